@@ -1,25 +1,75 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, send_file
 from flask_cors import CORS
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-import easyocr
+from PIL import Image, ImageDraw
 import os
 import requests
-from googletrans import Translator
 import base64
-import io
+import contextvars
 import json
+import queue
+import random
+import threading
+import time
+from contextlib import ExitStack
+from services.batch_pipeline import PagePipeline
+from services.translation_cache import get_shared_cache
+from services.translators import create_translation_service
+from services.result_cache import ResultCache, ResultHandleStore
+from services.artifact_store import ArtifactStore
+from services.model_registry import ModelRegistry, load_colorization_pipeline
+from services.ocr_pool import OCRReaderPool
+from services.job_queue import JobQueue, JobStore, QueueFullError
+from services.inpainting import inpaint_regions
+from services.bubble_grouping import group_text_areas
+from services.ocr import read_text, read_text_tiled, resolve_ocr_options, is_strip
+from services.phash import HashIndex, OCRMemo, phash
+from services.admission import (
+    AdmissionError, MemoryBudget, MemoryLedger, MEMORY_BUDGET_PATH, image_dimensions, check_pixels,
+    estimate_page_bytes, to_working_resolution, upscale_changes
+)
+from services.text_renderer import get_font_manager, render_label_block, rotate_label, composite_rgba
+from services.layout import MIN_ROTATION_DEGREES, bbox_array, box_geometry, rotated_extents, resolve_overlaps
+from services.metrics import (
+    registry as metrics_registry, timed, begin_request_timings, end_request_timings,
+    start_request_timings, cache_collector,
+    request_duration, requests_total, bytes_in, bytes_out, bubbles_per_page,
+    SamplingProfiler, save_profile
+)
 
 app = Flask(__name__)
 CORS(app)
 
+MAX_DOWNLOAD_BYTES = 10 * 1024 * 1024
+RENDER_FONT_PATH = os.environ.get('RENDER_FONT_PATH', 'arial.ttf')
+RENDER_MODE = os.environ.get('RENDER_MODE', 'inplace')
+GROUP_BUBBLES = os.environ.get('GROUP_BUBBLES', '1') == '1'
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '1.0'))
+PHASH_INDEX_PATH = os.environ.get('PHASH_INDEX_PATH', 'temp/phash_index.sqlite3')
+PAGE_DEDUP_DISTANCE = int(os.environ.get('PAGE_DEDUP_DISTANCE', '4'))
+OCR_MEMO_DISTANCE = int(os.environ.get('OCR_MEMO_DISTANCE', '2'))
+PREVIEW_MAX_SIZE = int(os.environ.get('PREVIEW_MAX_SIZE', '480'))
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', '15'))
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', 'temp/jobs.sqlite3')
+
 class MangaProcessor:
     def __init__(self):
-        self.ocr_reader = easyocr.Reader(['ja', 'en', 'ko', 'zh'])
-        self.translator = Translator()
+        self.ocr_readers = OCRReaderPool()
+        self.translation_cache = get_shared_cache()
+        self.models = ModelRegistry()
+        self.translators = create_translation_service(self.translation_cache, self.models)
+        self.fonts = get_font_manager()
+        self.artifacts = ArtifactStore()
+        self.models.register('colorizer', load_colorization_pipeline)
+        self.ocr_memo = OCRMemo(
+            HashIndex(bits=256, max_distance=OCR_MEMO_DISTANCE, db_path=PHASH_INDEX_PATH, table='bubbles')
+        ) if OCR_MEMO_DISTANCE >= 0 else None
         
+    @timed('download')
     def download_image(self, url):
+        """Fetch an image URL's bytes; decoding is left to the caller, once the page is admitted"""
         try:
             # Validate URL scheme to prevent SSRF attacks
             from urllib.parse import urlparse
@@ -28,6 +78,12 @@ class MangaProcessor:
             if parsed_url.scheme not in ['http', 'https']:
                 raise Exception("Only HTTP and HTTPS URLs are allowed")
             
+            # A URL fetched recently is served from its stored artifact without touching the network
+            artifact = self.artifacts.lookup_url(url)
+            buffer = self.artifacts.read(artifact) if artifact is not None else None
+            if buffer is not None:
+                return buffer
+            
             # Block private IP ranges and localhost
             import socket
             hostname = parsed_url.hostname
@@ -61,133 +117,167 @@ class MangaProcessor:
             
             # Check file size (max 10MB)
             content_length = response.headers.get('content-length')
-            if content_length and int(content_length) > 10 * 1024 * 1024:
+            if content_length and int(content_length) > MAX_DOWNLOAD_BYTES:
                 raise Exception("Image file too large (max 10MB)")
             
-            # Download with size limit
-            content = b''
-            for chunk in response.iter_content(chunk_size=8192):
-                content += chunk
-                if len(content) > 10 * 1024 * 1024:  # 10MB limit
+            # Download with size limit into a buffer sized up front when the length is known
+            buffer = bytearray(int(content_length) if content_length else 0)
+            view = memoryview(buffer)
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                end = size + len(chunk)
+                if end > MAX_DOWNLOAD_BYTES:
                     raise Exception("Image file too large (max 10MB)")
+                if end <= len(buffer):
+                    view[size:end] = chunk
+                else:
+                    view.release()
+                    del buffer[size:]
+                    buffer += chunk
+                    view = memoryview(buffer)
+                size = end
+            view.release()
+            del buffer[size:]
+            
+            artifact = self.artifacts.put(bytes(buffer), content_type.split(';')[0].strip())
+            self.artifacts.remember_url(url, artifact['id'])
             
-            image = Image.open(io.BytesIO(content))
-            temp_path = f"temp/downloaded_{abs(hash(url))}.jpg"
-            image.save(temp_path)
-            return temp_path
+            return buffer
         except Exception as e:
             raise Exception(f"Failed to download image: {str(e)}")
     
-    def detect_text_areas(self, image_path):
-        image = cv2.imread(image_path)
-        results = self.ocr_reader.readtext(image)
+    def decode_image(self, data):
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise Exception("Could not decode image")
+        return image
+    
+    @timed('ocr')
+    def detect_text_areas(self, image, source_lang='auto', ocr_options=None):
+        if isinstance(image, str):
+            image = cv2.imread(image)
+        options = resolve_ocr_options(ocr_options)
+        reader = self.ocr_readers.get(source_lang)
+        language = self.ocr_readers.resolve_language(source_lang)
+        if is_strip(image, options):
+            results = read_text_tiled(reader, image, options, self.ocr_memo, language)
+        else:
+            results = read_text(reader, image, options, self.ocr_memo, language)
         
         text_areas = []
         for (bbox, text, confidence) in results:
-            if confidence > 0.5:
-                text_areas.append({
-                    'bbox': bbox,
-                    'text': text,
-                    'confidence': confidence
-                })
+            text_areas.append({
+                'bbox': bbox,
+                'text': text,
+                'confidence': confidence
+            })
+        
+        if GROUP_BUBBLES:
+            text_areas = group_text_areas(text_areas)
         
         return text_areas, image
     
-    def translate_text(self, text, target_lang='en'):
-        try:
-            result = self.translator.translate(text, dest=target_lang)
-            return result.text
-        except Exception as e:
-            print(f"Translation error: {e}")
-            return text
+    def translate_text(self, text, target_lang='en', backend=None):
+        return self.translate_batch([text], target_lang, backend)[0]
+    
+    def translate_batch(self, texts, target_lang='en', backend=None, source_lang='auto', progress=None):
+        return self.translators.translate(texts, target_lang, backend, source_lang, progress=progress)
+    
+    @timed('translate')
+    def translate_text_areas(self, text_areas, target_lang='en', backend=None, source_lang='auto', progress=None):
+        translations = self.translate_batch([area['text'] for area in text_areas], target_lang, backend,
+                                            source_lang, progress)
+        for area, translated_text in zip(text_areas, translations):
+            area['translated'] = translated_text
+        return text_areas
+    
+    @timed('inpaint')
+    def remove_text_from_image(self, image, text_areas, in_place=False):
+        return inpaint_regions(image, text_areas, radius=3, flags=cv2.INPAINT_TELEA, in_place=in_place)
     
-    def remove_text_from_image(self, image, text_areas):
-        mask = np.zeros(image.shape[:2], dtype=np.uint8)
+    @timed('render')
+    def add_translated_text(self, image, text_areas, target_lang='en'):
+        if RENDER_MODE == 'pil':
+            return self._add_translated_text_pil(image, text_areas, target_lang)
         
-        for area in text_areas:
-            bbox = np.array(area['bbox'], dtype=np.int32)
-            cv2.fillPoly(mask, [bbox], 255)
+        # Composite small per-bubble label tiles straight onto the BGR buffer
+        for font, lines, line_height, center_x, start_y, angle in self._layout_labels(image, text_areas, target_lang):
+            tile, left, top = render_label_block(lines, font, line_height, center_x, start_y, line_height - 3)
+            if angle:
+                tile, left, top = rotate_label(tile, left, top, angle)
+            composite_rgba(image, tile, left, top)
         
-        inpainted = cv2.inpaint(image, mask, 3, cv2.INPAINT_TELEA)
-        return inpainted
+        return image
     
-    def add_translated_text(self, image, text_areas, target_lang='en'):
+    def _add_translated_text_pil(self, image, text_areas, target_lang='en'):
         pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
         draw = ImageDraw.Draw(pil_image)
         
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except:
-            font = ImageFont.load_default()
-        
-        for area in text_areas:
-            original_text = area['text']
-            translated_text = self.translate_text(original_text, target_lang)
-            
-            bbox = area['bbox']
-            center_x = sum([point[0] for point in bbox]) / 4
-            center_y = sum([point[1] for point in bbox]) / 4
+        for font, lines, line_height, center_x, start_y, angle in self._layout_labels(image, text_areas, target_lang):
+            box_height = line_height - 3
+            if angle:
+                tile, left, top = render_label_block(lines, font, line_height, center_x, start_y, box_height)
+                tile, left, top = rotate_label(tile, left, top, angle)
+                label = Image.fromarray(tile)
+                pil_image.paste(label, (left, top), label)
+                continue
             
-            bbox_width = max([point[0] for point in bbox]) - min([point[0] for point in bbox])
-            bbox_height = max([point[1] for point in bbox]) - min([point[1] for point in bbox])
-            
-            lines = self.wrap_text(translated_text, font, bbox_width - 10)
-            
-            total_height = len(lines) * 25
-            start_y = center_y - total_height / 2
-            
-            for i, line in enumerate(lines):
-                line_width = draw.textlength(line, font=font)
+            for i, (line, line_width) in enumerate(lines):
                 x = center_x - line_width / 2
-                y = start_y + i * 25
+                y = start_y + i * line_height
                 
-                draw.rectangle([x-2, y-2, x+line_width+2, y+22], fill='white', outline='black')
+                draw.rectangle([x-2, y-2, x+line_width+2, y+box_height], fill='white', outline='black')
                 draw.text((x, y), line, fill='black', font=font)
         
         return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
     
-    def wrap_text(self, text, font, max_width):
-        words = text.split()
-        lines = []
-        current_line = ""
+    def _layout_labels(self, image, text_areas, target_lang):
+        """Fit each label to its bubble, then move overlapping labels apart
         
-        for word in words:
-            test_line = current_line + (" " if current_line else "") + word
-            if hasattr(font, 'getlength'):
-                width = font.getlength(test_line)
-            else:
-                width = len(test_line) * 10
-                
-            if width <= max_width:
-                current_line = test_line
-            else:
-                if current_line:
-                    lines.append(current_line)
-                current_line = word
+        Returns (font, lines, line_height, center_x, start_y, angle) per area; angle is 0 for upright
+        labels, else the bubble's tilt in degrees.
+        """
+        if not text_areas:
+            return []
         
-        if current_line:
-            lines.append(current_line)
+        geometry = box_geometry(bbox_array(text_areas))
+        angles = np.where(np.abs(geometry['angle']) >= MIN_ROTATION_DEGREES, geometry['angle'], 0.0)
+        # Upright labels fill the axis-aligned box, tilted ones the box along its own axes
+        fit_sizes = np.where((angles == 0)[:, None], geometry['extents'], geometry['sizes'])
+        
+        fitted = []
+        label_sizes = np.empty((len(text_areas), 2))
+        for i, area in enumerate(text_areas):
+            translated_text = area.get('translated')
+            if translated_text is None:
+                translated_text = self.translate_text(area['text'], target_lang)
+            
+            font, lines, line_height = self.fonts.fit_text(
+                translated_text, RENDER_FONT_PATH, fit_sizes[i, 0] - 10, fit_sizes[i, 1],
+                min_size=12, max_size=20
+            )
+            fitted.append((font, lines, line_height))
+            label_sizes[i] = (max(width for _, width in lines) + 6, len(lines) * line_height)
         
-        return lines if lines else [text]
+        centers = resolve_overlaps(geometry['centers'], rotated_extents(label_sizes, angles),
+                                   (image.shape[1], image.shape[0]))
+        return [
+            (font, lines, line_height, float(center_x), float(center_y) - len(lines) * line_height / 2, float(angle))
+            for (font, lines, line_height), (center_x, center_y), angle in zip(fitted, centers, angles)
+        ]
+    
+    def wrap_text(self, text, font, max_width):
+        return [line for line, _ in self.fonts.wrap_text(text, font, max_width)]
     
+    @timed('colorize')
     def colorize_manga(self, image):
         try:
-            from diffusers import StableDiffusionImg2ImgPipeline
-            import torch
-            
-            pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
-                "runwayml/stable-diffusion-v1-5",
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
-            )
-            
-            if torch.cuda.is_available():
-                pipe = pipe.to("cuda")
-            
             pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
             
             prompt = "colorful manga artwork, vibrant colors, anime style, detailed illustration"
             
-            result = pipe(prompt=prompt, image=pil_image, strength=0.7).images[0]
+            with self.models.use('colorizer') as pipe:
+                result = pipe(prompt=prompt, image=pil_image, strength=0.7).images[0]
             
             return cv2.cvtColor(np.array(result), cv2.COLOR_RGB2BGR)
             
@@ -195,41 +285,342 @@ class MangaProcessor:
             print(f"Coloring error: {e}")
             return image
 
+PIPELINE_VERSION = '4'
+
 processor = MangaProcessor()
+result_cache = ResultCache(processor.artifacts)
+result_handles = ResultHandleStore(processor.artifacts)
+memory_budget = MemoryBudget(ledger=MemoryLedger(MEMORY_BUDGET_PATH) if MEMORY_BUDGET_PATH else None)
+# Maps perceptual page hashes to result cache keys; a match is only a candidate until its text is confirmed
+page_hashes = HashIndex(bits=64, max_distance=max(PAGE_DEDUP_DISTANCE, 0), db_path=PHASH_INDEX_PATH, table='pages')
+
+metrics_registry.register_collector(cache_collector('translation', processor.translation_cache.stats))
+metrics_registry.register_collector(cache_collector('result', result_cache.stats))
+if processor.ocr_memo is not None:
+    metrics_registry.register_collector(cache_collector('ocr_memo', processor.ocr_memo.stats))
+
+WARMUP_MODELS = [name for name in os.environ.get('WARMUP_MODELS', '').split(',') if name]
+WARMUP_OCR_LANGUAGES = [language for language in os.environ.get('WARMUP_OCR_LANGUAGES', '').split(',') if language]
+
+def warm_up(blocking=False):
+    """Load the configured models; blocking is used before forking workers so they share the weights"""
+    if not blocking:
+        if WARMUP_MODELS:
+            processor.models.warm_up(WARMUP_MODELS)
+        for language in WARMUP_OCR_LANGUAGES:
+            threading.Thread(target=processor.ocr_readers.get, args=(language,), daemon=True).start()
+        return
+    
+    for name in WARMUP_MODELS:
+        try:
+            processor.models.get(name)
+        except Exception as e:
+            print(f"Warm-up of model '{name}' failed: {e}")
+    for language in WARMUP_OCR_LANGUAGES:
+        try:
+            processor.ocr_readers.get(language)
+        except Exception as e:
+            print(f"Warm-up of OCR reader '{language}' failed: {e}")
+
+def after_fork():
+    """Reset per-process state in a worker forked from a preloaded master"""
+    processor.translation_cache.reopen()
+    processor.models.reset_after_fork()
+    page_hashes.reopen()
+    processor.artifacts.sweep()
+    job_queue.reopen()
+    memory_budget.reopen()
+    if processor.ocr_memo is not None:
+        processor.ocr_memo.index.reopen()
+
+def readiness():
+    loaded_languages = processor.ocr_readers.loaded()
+    pending_models = [name for name in WARMUP_MODELS if not processor.models.is_loaded(name)]
+    pending_languages = [language for language in WARMUP_OCR_LANGUAGES
+                         if processor.ocr_readers.resolve_language(language) not in loaded_languages]
+    return {
+        'ready': not pending_models and not pending_languages,
+        'pendingModels': pending_models,
+        'pendingOcrLanguages': pending_languages
+    }
+
+# Under the production server the master process preloads synchronously instead (see gunicorn.conf.py)
+if os.environ.get('PRELOAD_MODELS') != '1':
+    warm_up()
+
+OUTPUT_FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'png': ('.png', 'image/png', None),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY)
+}
+
+def resolve_output_format(output_format, source_name=None):
+    """Explicit format, else the source file's own format, else JPEG"""
+    if not output_format:
+        extension = os.path.splitext(source_name or '')[1].lower()
+        output_format = {'.png': 'png', '.webp': 'webp'}.get(extension, 'jpeg')
+    output_format = output_format.lower().replace('jpg', 'jpeg')
+    if output_format not in OUTPUT_FORMATS:
+        raise Exception(f"Unsupported output format: {output_format}")
+    return output_format
+
+@timed('encode')
+def encode_image(image, output_format, quality=None):
+    extension, mime_type, quality_flag = OUTPUT_FORMATS[output_format]
+    params = [quality_flag, int(quality)] if quality_flag is not None and quality else []
+    
+    ok, buffer = cv2.imencode(extension, image, params)
+    if not ok:
+        raise Exception(f"Failed to encode image as {output_format}")
+    return buffer.tobytes(), mime_type
+
+def encode_preview(image):
+    """Small JPEG data URL of a page, cheap enough to send before the final encode"""
+    scale = PREVIEW_MAX_SIZE / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    if not ok:
+        raise Exception("Failed to encode preview")
+    return f"data:image/jpeg;base64,{base64.b64encode(buffer).decode()}"
+
+def read_image_file(image_path):
+    with open(image_path, "rb") as img_file:
+        return img_file.read()
+
+def cached_page(cached):
+    image_bytes, meta = cached
+    bytes_out.inc(len(image_bytes))
+    return {
+        'imageBytes': image_bytes,
+        'mimeType': meta['mimeType'],
+        'textAreas': meta['textAreas'],
+        'artifactId': meta.get('artifactId'),
+        'cached': True
+    }
+
+def process_page(image_bytes, target_language, enable_coloring, source_language='auto',
+                 output_format='jpeg', quality=None, ocr_options=None, translator=None, progress=None,
+                 preview=False, stream=False):
+    """stream adds translate_progress events, at the cost of translating in several smaller backend calls"""
+    progress = progress or (lambda stage, info=None: None)
+    
+    bytes_in.inc(len(image_bytes))
+    
+    options = {
+        'sourceLanguage': processor.ocr_readers.resolve_language(source_language),
+        'targetLanguage': target_language,
+        'enableColoring': bool(enable_coloring),
+        'outputFormat': output_format,
+        'quality': quality,
+        'ocrOptions': ocr_options,
+        'translator': processor.translators.resolve(translator),
+        'pipelineVersion': PIPELINE_VERSION
+    }
+    cache_key = ResultCache.make_key(image_bytes, options)
+    
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached_page(cached)
+    
+    # Admission is decided from the header, before the pixels are decoded
+    width, height = image_dimensions(image_bytes)
+    check_pixels(width, height)
+    
+    with memory_budget.reserve(estimate_page_bytes(width, height)):
+        image = processor.decode_image(image_bytes)
+        return render_page(image, cache_key, options, target_language, enable_coloring, source_language,
+                           output_format, quality, ocr_options, translator, progress, preview, stream)
+
+def render_page(image, cache_key, options, target_language, enable_coloring, source_language,
+                output_format, quality, ocr_options, translator, progress, preview, stream):
+    page_key = None
+    candidates = []
+    if PAGE_DEDUP_DISTANCE >= 0:
+        # Near-duplicates must match the options and the exact size, since the stored output is reused as is
+        page_namespace = f"{ResultCache.make_key(b'', options)}:{image.shape[1]}x{image.shape[0]}"
+        page_key = phash(image)
+        candidates = [match_key for match_key, _ in page_hashes.candidates(page_namespace, page_key)]
+    
+    # Oversized pages are worked on downscaled; only the regions that change are upscaled back at the end
+    working_image, scale = to_working_resolution(image)
+    reference = working_image.copy() if scale < 1 else None
+    
+    text_areas, original_image = processor.detect_text_areas(working_image, source_language, ocr_options)
+    bubbles_per_page.observe(len(text_areas))
+    progress('ocr_done', {'textAreas': len(text_areas)})
+    
+    # The pHash only sees the artwork; reuse a similar page's output only if its dialogue is the same
+    texts = [area['text'] for area in text_areas]
+    for match_key in candidates:
+        cached = result_cache.get(match_key)
+        if cached is None:
+            # Its output has been evicted from the result cache
+            page_hashes.discard(page_namespace, page_key, match_key)
+        elif cached[1].get('texts') == texts:
+            return cached_page(cached)
+    
+    # The original is not needed after inpainting, so skip the full-frame copy
+    cleaned_image = processor.remove_text_from_image(original_image, text_areas, in_place=True)
+    progress('inpaint_done')
+    
+    # Per-chunk progress splits the batch, so only streamed requests ask for it
+    processor.translate_text_areas(
+        text_areas, target_language, translator, options['sourceLanguage'],
+        (lambda done, total: progress('translate_progress', {'done': done, 'total': total})) if stream else None
+    )
+    progress('translate_done')
+    translated_image = processor.add_translated_text(cleaned_image, text_areas, target_language)
+    progress('render_done')
+    if preview:
+        progress('preview', {'image': encode_preview(translated_image)})
+    
+    if enable_coloring:
+        translated_image = processor.colorize_manga(translated_image)
+        progress('colorize_done')
+    
+    if reference is not None:
+        translated_image = upscale_changes(image, reference, translated_image, scale)
+    
+    image_bytes, mime_type = encode_image(translated_image, output_format, quality)
+    artifact_id = result_cache.put(cache_key, image_bytes,
+                                   {'textAreas': len(text_areas), 'mimeType': mime_type, 'texts': texts})
+    if page_key is not None:
+        page_hashes.add(page_namespace, page_key, cache_key)
+    bytes_out.inc(len(image_bytes))
+    
+    return {
+        'imageBytes': image_bytes,
+        'mimeType': mime_type,
+        'textAreas': len(text_areas),
+        'artifactId': artifact_id,
+        'cached': False
+    }
+
+def page_to_json(page):
+    # Pages that went through the result cache are already stored; only touch their artifact
+    artifact = processor.artifacts.get(page['artifactId']) if page.get('artifactId') else None
+    if artifact is None:
+        artifact = processor.artifacts.put(page['imageBytes'], page['mimeType'])
+    
+    img_base64 = base64.b64encode(page['imageBytes']).decode()
+    
+    return {
+        'success': True,
+        'processedImage': f"data:{page['mimeType']};base64,{img_base64}",
+        'textAreas': page['textAreas'],
+        'outputPath': artifact['path'],
+        'artifactId': artifact['id'],
+        'artifactUrl': f"/artifacts/{artifact['id']}",
+        'cached': page['cached']
+    }
+
+def page_response(page, data):
+    if data.get('responseMode') == 'binary':
+        return Response(page['imageBytes'], mimetype=page['mimeType'], headers={
+            'X-Text-Areas': str(page['textAreas']),
+            'X-Cache': 'HIT' if page['cached'] else 'MISS'
+        })
+    return jsonify(page_body(page, data, g.timings if data.get('timing') else None))
+
+def page_body(page, data, timings=None):
+    if data.get('responseMode') == 'handle':
+        handle = result_handles.put(page['imageBytes'], page['mimeType'])
+        body = {
+            'success': True,
+            'resultId': handle,
+            'resultUrl': f"/results/{handle}",
+            'mimeType': page['mimeType'],
+            'expiresIn': result_handles.ttl,
+            'textAreas': page['textAreas'],
+            'cached': page['cached']
+        }
+    else:
+        body = page_to_json(page)
+    
+    if timings is not None:
+        body['timings'] = timings
+    return body
+
+def stream_events(data, work):
+    """Run work(progress) -> page in a background thread and stream its progress events, then the result
+
+    data['stream'] selects 'sse' (text/event-stream) or NDJSON (anything else truthy).
+    """
+    sse = data.get('stream') == 'sse'
+    events = queue.Queue()
+    started = time.time()
+    timings = g.timings if data.get('timing') else None
+    
+    def progress(stage, info=None):
+        events.put({'event': stage, 'elapsedMs': round((time.time() - started) * 1000, 1), **(info or {})})
+    
+    def run():
+        try:
+            events.put({'event': 'result', **page_body(work(progress), data, timings)})
+        except Exception as e:
+            events.put({'event': 'error', 'error': str(e)})
+        events.put(None)
+    
+    # The copied context carries the request's stage timings into the worker thread
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+    
+    def generate():
+        while True:
+            try:
+                event = events.get(timeout=STREAM_HEARTBEAT)
+            except queue.Empty:
+                event = {'event': 'heartbeat', 'elapsedMs': round((time.time() - started) * 1000, 1)}
+            if event is None:
+                return
+            if sse:
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            else:
+                yield json.dumps(event) + '\n'
+    
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream' if sse else 'application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def page_options(data, source_name=None):
+    return {
+        'target_language': data.get('targetLanguage', 'en'),
+        'enable_coloring': data.get('enableColoring', False),
+        'source_language': data.get('sourceLanguage', 'auto'),
+        'output_format': resolve_output_format(data.get('outputFormat'), source_name),
+        'quality': data.get('quality'),
+        'ocr_options': resolve_ocr_options(data.get('ocrOptions')),
+        'translator': processor.translators.resolve(data.get('translator'))
+    }
+
+def admission_response(error):
+    headers = {'Retry-After': str(error.retry_after)} if error.status == 503 else {}
+    return jsonify({'error': str(error)}), error.status, headers
 
 @app.route('/process', methods=['POST'])
 def process_manga():
     try:
         data = request.json
         image_path = data.get('imagePath')
-        target_language = data.get('targetLanguage', 'en')
-        enable_coloring = data.get('enableColoring', False)
         
         if not os.path.exists(image_path):
             return jsonify({'error': 'Image file not found'}), 400
         
-        text_areas, original_image = processor.detect_text_areas(image_path)
-        
-        cleaned_image = processor.remove_text_from_image(original_image, text_areas)
-        
-        translated_image = processor.add_translated_text(cleaned_image, text_areas, target_language)
-        
-        if enable_coloring:
-            translated_image = processor.colorize_manga(translated_image)
-        
-        output_path = f"temp/processed_{os.path.basename(image_path)}"
-        cv2.imwrite(output_path, translated_image)
-        
-        with open(output_path, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode()
+        try:
+            options = page_options(data, image_path)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
+        if data.get('stream'):
+            return stream_events(data, lambda progress: process_page(
+                read_image_file(image_path), progress=progress, preview=bool(data.get('preview')), stream=True,
+                **options
+            ))
         
-        return jsonify({
-            'success': True,
-            'processedImage': f"data:image/jpeg;base64,{img_base64}",
-            'textAreas': len(text_areas),
-            'outputPath': output_path
-        })
+        page = process_page(read_image_file(image_path), **options)
+        return page_response(page, data)
         
+    except AdmissionError as e:
+        return admission_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -238,36 +629,303 @@ def process_url():
     try:
         data = request.json
         url = data.get('url')
-        target_language = data.get('targetLanguage', 'en')
-        enable_coloring = data.get('enableColoring', False)
-        
-        image_path = processor.download_image(url)
-        
-        text_areas, original_image = processor.detect_text_areas(image_path)
-        
-        cleaned_image = processor.remove_text_from_image(original_image, text_areas)
+        try:
+            options = page_options(data)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
         
-        translated_image = processor.add_translated_text(cleaned_image, text_areas, target_language)
+        if data.get('stream'):
+            def work(progress):
+                # Decoding waits for admission inside process_page
+                image_bytes = processor.download_image(url)
+                progress('download_done', {'bytes': len(image_bytes)})
+                return process_page(image_bytes, progress=progress, preview=bool(data.get('preview')), stream=True,
+                                    **options)
+            return stream_events(data, work)
         
-        if enable_coloring:
-            translated_image = processor.colorize_manga(translated_image)
+        image_bytes = processor.download_image(url)
+        page = process_page(image_bytes, **options)
+        return page_response(page, data)
         
-        output_path = f"temp/processed_url_{hash(url)}.jpg"
-        cv2.imwrite(output_path, translated_image)
+    except AdmissionError as e:
+        return admission_response(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/results/<handle>', methods=['GET'])
+def get_result(handle):
+    entry = result_handles.get(handle)
+    if entry is None:
+        return jsonify({'error': 'Result not found or expired'}), 404
+    image_bytes, mime_type = entry
+    return Response(image_bytes, mimetype=mime_type)
+
+@app.route('/artifacts/<artifact_id>', methods=['GET'])
+def get_artifact(artifact_id):
+    artifact = processor.artifacts.get(artifact_id)
+    if artifact is None:
+        return jsonify({'error': 'Artifact not found'}), 404
+    # Ids are content hashes, so an artifact never changes once written
+    response = send_file(os.path.abspath(artifact['path']), mimetype=artifact['mimeType'], etag=artifact['id'],
+                         max_age=365 * 24 * 3600, conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def run_job(payload, progress):
+    if payload.get('url'):
+        progress('downloading')
+        image_bytes = processor.download_image(payload['url'])
+        source_name = None
+    else:
+        image_path = payload.get('imagePath')
+        if not image_path or not os.path.exists(image_path):
+            raise Exception('Image file not found')
+        image_bytes = read_image_file(image_path)
+        source_name = image_path
+    
+    with start_request_timings() as timings:
+        page = process_page(image_bytes, progress=progress, **page_options(payload, source_name))
+    
+    result = page_to_json(page)
+    if payload.get('timing'):
+        result['timings'] = timings
+    return result
+
+job_queue = JobQueue(
+    run_job,
+    num_workers=int(os.environ.get('JOB_WORKERS', '2')),
+    max_pending=int(os.environ.get('JOB_MAX_PENDING', '32')),
+    result_ttl=float(os.environ.get('JOB_RESULT_TTL', '600')),
+    # Shared so any server process can answer for a job, whichever one accepted it
+    store=JobStore(JOB_DB_PATH) if JOB_DB_PATH else None
+)
+
+def job_status(job):
+    return {key: value for key, value in job.items() if key != 'result'}
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    data = request.json or {}
+    if not data.get('imagePath') and not data.get('url'):
+        return jsonify({'error': 'imagePath or url is required'}), 400
+    try:
+        page_options(data, data.get('imagePath'))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        job_id = job_queue.submit(data)
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '5'}
+    
+    return jsonify({'jobId': job_id, 'status': 'queued'}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    wait = float(request.args.get('wait', 0))
+    if wait > 0:
+        job = job_queue.wait(job_id, float(request.args.get('since', 0)), min(wait, 60))
+    else:
+        job = job_queue.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_status(job))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error']}), 500
+    if job['status'] != 'done':
+        return jsonify(job_status(job)), 409
+    return jsonify(job['result'])
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        last_updated = 0
+        while True:
+            job = job_queue.wait(job_id, last_updated)
+            if job is None:
+                return
+            if job['updatedAt'] > last_updated:
+                last_updated = job['updatedAt']
+                yield json.dumps(job_status(job)) + '\n'
+            if job['status'] in ('done', 'failed'):
+                return
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.timings, g.timings_token = begin_request_timings()
+    g.profiler = None
+    if PROFILE_SLOW_MS > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_duration.observe(elapsed, route=route)
+    requests_total.inc(route=route, status=str(response.status_code))
+    
+    if g.timings:
+        response.headers['Server-Timing'] = ', '.join(
+            f"{stage};dur={duration}" for stage, duration in g.timings.items()
+        )
+    
+    if g.profiler is not None:
+        g.profiler.stop()
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            print(f"Slow request {route} took {elapsed * 1000:.0f}ms, profile saved to {save_profile(g.profiler, route, elapsed)}")
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc=None):
+    token = g.pop('timings_token', None)
+    if token is not None:
+        end_request_timings(token)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({
+        'status': 'ok',
+        'ready': readiness()['ready'],
+        'memory': memory_budget.stats(),
+        'ocrReaders': processor.ocr_readers.status(),
+        'models': processor.models.status(),
+        'translators': {'default': processor.translators.default, 'available': processor.translators.names()},
+        'jobs': job_queue.stats()
+    })
+
+@app.route('/livez', methods=['GET'])
+def livez():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    state = readiness()
+    return jsonify(state), 200 if state['ready'] else 503
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'translation': processor.translation_cache.stats(),
+        'results': result_cache.stats(),
+        'pageHashes': len(page_hashes),
+        'ocrMemo': processor.ocr_memo.stats() if processor.ocr_memo is not None else None,
+        'artifacts': processor.artifacts.stats()
+    })
+
+@app.route('/process-batch', methods=['POST'])
+def process_batch():
+    data = request.json
+    pages = data.get('pages', [])
+    target_language = data.get('targetLanguage', 'en')
+    enable_coloring = data.get('enableColoring', False)
+    source_language = data.get('sourceLanguage', 'auto')
+    
+    if not pages:
+        return jsonify({'error': 'No pages provided'}), 400
+    
+    try:
+        ocr_options = resolve_ocr_options(data.get('ocrOptions'))
+        translator = processor.translators.resolve(data.get('translator'))
+        # An explicit format is checked now; an empty one depends on each page's file name
+        resolve_output_format(data.get('outputFormat'))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def detect(item):
+        page = item['page']
+        if page.get('url'):
+            image_bytes = processor.download_image(page['url'])
+            item['name'] = None
+        else:
+            image_path = page.get('imagePath')
+            if not image_path or not os.path.exists(image_path):
+                raise Exception('Image file not found')
+            image_bytes = read_image_file(image_path)
+            item['name'] = image_path
+        width, height = image_dimensions(image_bytes)
+        check_pixels(width, height)
+        # Held from decode until the page leaves the pipeline, however many stages it is spread over
+        item['reservation'] = ExitStack()
+        item['reservation'].enter_context(memory_budget.reserve(estimate_page_bytes(width, height)))
+        image = processor.decode_image(image_bytes)
         
-        with open(output_path, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode()
+        # Same working-resolution handling as single pages; the encode stage restores full size
+        working_image, item['scale'] = to_working_resolution(image)
+        if item['scale'] < 1:
+            item['original'], item['reference'] = image, working_image.copy()
+        item['text_areas'], item['image'] = processor.detect_text_areas(working_image, page.get('sourceLanguage', source_language), ocr_options)
+        return item
+    
+    def inpaint(item):
+        item['image'] = processor.remove_text_from_image(item['image'], item['text_areas'], in_place=True)
+        return item
+    
+    def translate(item):
+        source = processor.ocr_readers.resolve_language(item['page'].get('sourceLanguage', source_language))
+        processor.translate_text_areas(item['text_areas'], target_language, translator, source)
+        return item
+    
+    def render(item):
+        item['image'] = processor.add_translated_text(item['image'], item['text_areas'], target_language)
+        return item
+    
+    def colorize(item):
+        item['image'] = processor.colorize_manga(item['image'])
+        return item
+    
+    def encode(item):
+        output_format = resolve_output_format(data.get('outputFormat'), item['name'])
+        if item['scale'] < 1:
+            item['image'] = upscale_changes(item.pop('original'), item.pop('reference'), item['image'], item['scale'])
+        image_bytes, mime_type = encode_image(item['image'], output_format, data.get('quality'))
         
-        return jsonify({
-            'success': True,
-            'processedImage': f"data:image/jpeg;base64,{img_base64}",
-            'textAreas': len(text_areas),
-            'outputPath': output_path
+        item['result'] = page_to_json({
+            'imageBytes': image_bytes,
+            'mimeType': mime_type,
+            'textAreas': len(item['text_areas']),
+            'cached': False
         })
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return item
+    
+    stages = [('ocr', detect), ('inpaint', inpaint), ('translate', translate), ('render', render)]
+    if enable_coloring:
+        stages.append(('colorize', colorize))
+    stages.append(('encode', encode))
+    
+    def release(item):
+        if 'reservation' in item:
+            item.pop('reservation').close()
+    
+    def generate():
+        for item in PagePipeline(stages, on_discard=release).run(pages):
+            release(item)
+            if 'error' in item:
+                result = {'success': False, 'error': item['error']}
+            else:
+                result = item['result']
+            result['index'] = item['index']
+            yield json.dumps(result) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 if __name__ == '__main__':
     os.makedirs('temp', exist_ok=True)
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # Development server only; production runs gunicorn -c gunicorn.conf.py app:app
+    app.run(host='0.0.0.0', port=int(os.environ.get('AI_SERVICE_PORT', '5001')), debug=os.environ.get('FLASK_DEBUG') == '1')
\ No newline at end of file
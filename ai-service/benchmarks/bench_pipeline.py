@@ -0,0 +1,288 @@
+"""Benchmark the MangaProcessor stages on synthetic manga pages
+
+Run from the ai-service directory:
+
+    python benchmarks/bench_pipeline.py --resolutions 800x1200,1600x2400 --bubbles 4,16
+    python benchmarks/bench_pipeline.py --baseline benchmarks/results/previous.json
+
+Pages are rendered text bubbles on noise and screentone backgrounds. Translation is stubbed, and the
+caches are disabled so every iteration does the full work. Stages needing EasyOCR are skipped when
+it is not installed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Caches would turn repeated iterations into lookups; configure before importing the app
+os.environ.setdefault('TRANSLATION_CACHE_PATH', '')
+os.environ.setdefault('RESULT_CACHE_DIR', '')
+os.environ.setdefault('PAGE_DEDUP_DISTANCE', '-1')
+os.environ.setdefault('OCR_MEMO_DISTANCE', '-1')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import app as service
+from services.translators import TranslatorBackend
+
+WORDS = ('the', 'sword', 'wait', 'run', 'never', 'again', 'friend', 'tonight', 'what', 'is', 'this',
+         'power', 'I', 'will', 'protect', 'you', 'no', 'way', 'captain', 'hurry', 'up', 'behind')
+
+STAGES = ('detect', 'inpaint', 'wrap', 'render', 'process')
+
+
+class StubBackend(TranslatorBackend):
+    """Deterministic offline translator, so network latency never enters the numbers"""
+
+    name = 'stub'
+    cache_namespace = 'stub'
+
+    def translate_batch(self, texts, target_lang, source_lang='auto', context='manga'):
+        # English output runs longer than the source, which is what the wrapper has to cope with
+        return [f"{text} {text.lower()}" for text in texts]
+
+
+def screentone(height, width, rng):
+    """Grey noise with a halftone dot pattern, like the shaded areas of a scanned page"""
+    page = rng.normal(235, 12, (height, width)).clip(0, 255).astype(np.uint8)
+    spacing = 6
+    ys, xs = np.mgrid[0:height, 0:width]
+    dots = ((ys % spacing - spacing / 2) ** 2 + (xs % spacing - spacing / 2) ** 2) < 3
+    shaded = np.zeros((height, width), dtype=bool)
+    for _ in range(4):
+        x0, y0 = rng.integers(0, width), rng.integers(0, height)
+        shaded[y0:y0 + height // 3, x0:x0 + width // 3] = True
+    page[dots & shaded] = 90
+    return cv2.cvtColor(page, cv2.COLOR_GRAY2BGR)
+
+
+def make_page(width, height, bubbles, seed=0):
+    """Render a synthetic page; returns (image, text areas in the OCR output format)"""
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    image = screentone(height, width, rng)
+    text_areas = []
+
+    columns = max(1, int(np.ceil(np.sqrt(bubbles * width / height))))
+    rows = int(np.ceil(bubbles / columns))
+    cell_w, cell_h = width // columns, height // rows
+    scale = max(0.5, min(cell_w, cell_h) / 400)
+
+    for index in range(bubbles):
+        cx = (index % columns) * cell_w + cell_w // 2
+        cy = (index // columns) * cell_h + cell_h // 2
+        axes = (int(cell_w * 0.42), int(cell_h * 0.35))
+        cv2.ellipse(image, (cx, cy), axes, 0, 0, 360, (255, 255, 255), -1)
+        cv2.ellipse(image, (cx, cy), axes, 0, 0, 360, (0, 0, 0), 2)
+
+        lines = [' '.join(words.choice(WORDS) for _ in range(words.randint(2, 4))).upper()
+                 for _ in range(words.randint(1, 3))]
+        line_height = int(32 * scale)
+        top = cy - len(lines) * line_height // 2
+        for i, line in enumerate(lines):
+            (text_w, text_h), _ = cv2.getTextSize(line, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+            x0, y0 = cx - text_w // 2, top + i * line_height
+            cv2.putText(image, line, (x0, y0 + text_h), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), 2)
+            x1, y1 = x0 + text_w, y0 + text_h + 6
+            text_areas.append({
+                'bbox': [[x0, y0], [x1, y0], [x1, y1], [x0, y1]],
+                'text': line,
+                'confidence': 0.99
+            })
+
+    return image, text_areas
+
+
+def ocr_available():
+    try:
+        import easyocr  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def reset_peak_rss():
+    """Start a new peak-RSS window (Linux); False where only the lifetime peak is available"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss, or over the process lifetime where it can't be reset"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(run, repeat, warmup):
+    # Without a reset the figure is the largest case run so far, not this one
+    per_case = reset_peak_rss()
+    for _ in range(warmup):
+        run()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    samples = np.array(samples) * 1000
+    return {
+        'iterations': repeat,
+        'meanMs': round(float(samples.mean()), 3),
+        'p50Ms': round(float(np.percentile(samples, 50)), 3),
+        'p95Ms': round(float(np.percentile(samples, 95)), 3),
+        'pagesPerSecond': round(1000 * repeat / float(samples.sum()), 3),
+        'peakRssMb': round(peak_rss_mb(), 1),
+        'peakRssScope': 'case' if per_case else 'process'
+    }
+
+
+def stage_runners(image, text_areas, page_path, target_language):
+    processor = service.processor
+    client = service.app.test_client()
+    translated = [dict(area, translated=f"{area['text']} {area['text'].lower()}") for area in text_areas]
+    font = processor.fonts.get_font(service.RENDER_FONT_PATH, 16)
+
+    def wrap():
+        for area in translated:
+            xs = [point[0] for point in area['bbox']]
+            processor.wrap_text(area['translated'], font, max(xs) - min(xs))
+
+    def process():
+        response = client.post('/process', json={
+            'imagePath': page_path,
+            'targetLanguage': target_language,
+            'sourceLanguage': 'en',
+            'translator': 'stub',
+            'responseMode': 'binary'
+        })
+        if response.status_code != 200:
+            raise Exception(f"/process returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+    return {
+        'detect': lambda: processor.detect_text_areas(image.copy(), 'en'),
+        'inpaint': lambda: processor.remove_text_from_image(image.copy(), text_areas, in_place=True),
+        'wrap': wrap,
+        'render': lambda: processor.add_translated_text(image.copy(), translated, target_language),
+        'process': process
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Print p50 changes against a saved baseline; returns the cases slower than the threshold"""
+    with open(baseline_path) as baseline_file:
+        baseline = {(r['stage'], r['resolution'], r['bubbles']): r for r in json.load(baseline_file)['results']}
+
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        key = (result['stage'], result['resolution'], result['bubbles'])
+        previous = baseline.get(key)
+        if previous is None or 'p50Ms' not in result or 'p50Ms' not in previous:
+            continue
+        change = 100 * (result['p50Ms'] - previous['p50Ms']) / max(previous['p50Ms'], 1e-9)
+        flag = ' REGRESSION' if change > threshold else ''
+        print(f"  {key[0]:8} {key[1]:>10} {key[2]:>3} bubbles  p50 {previous['p50Ms']:9.2f} -> "
+              f"{result['p50Ms']:9.2f} ms ({change:+.1f}%){flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resolutions', default='800x1200,1600x2400', help='comma-separated WIDTHxHEIGHT list')
+    parser.add_argument('--bubbles', default='4,16', help='comma-separated bubble counts')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"subset of {','.join(STAGES)}")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--target-language', default='en')
+    parser.add_argument('--output', help='where to save the JSON results (default benchmarks/results/bench_<time>.json)')
+    parser.add_argument('--baseline', help='earlier JSON results to compare p50 latency against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='p50 slowdown in percent counted as a regression')
+    args = parser.parse_args()
+
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    service.processor.translators.register('stub', StubBackend)
+    has_ocr = ocr_available()
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for resolution in args.resolutions.split(','):
+            width, height = (int(v) for v in resolution.lower().split('x'))
+            for bubbles in (int(v) for v in args.bubbles.split(',')):
+                image, text_areas = make_page(width, height, bubbles, seed=width * 1000 + bubbles)
+                page_path = os.path.join(workdir, f"page_{resolution}_{bubbles}.png")
+                cv2.imwrite(page_path, image)
+                runners = stage_runners(image, text_areas, page_path, args.target_language)
+
+                for stage in stages:
+                    result = {'stage': stage, 'resolution': resolution, 'bubbles': bubbles}
+                    if stage in ('detect', 'process') and not has_ocr:
+                        result['skipped'] = 'easyocr is not installed'
+                    else:
+                        result.update(measure(runners[stage], args.repeat, args.warmup))
+                    results.append(result)
+
+                    if 'skipped' in result:
+                        print(f"{stage:8} {resolution:>10} {bubbles:>3} bubbles  skipped: {result['skipped']}")
+                    else:
+                        print(f"{stage:8} {resolution:>10} {bubbles:>3} bubbles  p50 {result['p50Ms']:9.2f} ms  "
+                              f"p95 {result['p95Ms']:9.2f} ms  {result['pagesPerSecond']:8.2f} pages/s  "
+                              f"peak RSS {result['peakRssMb']:.0f} MB")
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                                         f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump({
+            'meta': {
+                'createdAt': time.time(),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'repeat': args.repeat,
+                'warmup': args.warmup
+            },
+            'results': results
+        }, output_file, indent=2)
+    print(f"\nSaved results to {output}")
+
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
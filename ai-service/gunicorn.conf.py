@@ -0,0 +1,69 @@
+"""Production server settings: gunicorn -c gunicorn.conf.py app:app
+
+The app is imported and its models are loaded once in the master process, then workers are forked
+and share those weights copy-on-write instead of each loading their own.
+"""
+import gc
+import os
+
+# Tell the app to skip its background warm-up threads; the master loads synchronously in when_ready
+os.environ.setdefault('PRELOAD_MODELS', '1')
+
+bind = f"0.0.0.0:{os.environ.get('AI_SERVICE_PORT', '5001')}"
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+# Threads keep streaming NDJSON responses and health checks from blocking a whole worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+# OCR, inpainting and colorization of a large page can take minutes on CPU
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '300'))
+graceful_timeout = 30
+preload_app = True
+accesslog = '-'
+
+# Split the cores between workers so torch and OpenCV don't each start a thread per core in every worker
+_default_threads = str(max(1, (os.cpu_count() or 1) // max(workers, 1)))
+WORKER_TORCH_THREADS = int(os.environ.get('WORKER_TORCH_THREADS') or _default_threads)
+WORKER_OPENCV_THREADS = int(os.environ.get('WORKER_OPENCV_THREADS') or _default_threads)
+
+# Set in the master once models are loaded; workers forked without it warm up on their own
+_preloaded = False
+
+
+def when_ready(server):
+    global _preloaded
+    import app
+
+    try:
+        import torch
+        if torch.cuda.is_available():
+            # CUDA contexts can't be inherited across fork(); each worker loads lazily instead
+            server.log.info("CUDA available, skipping model preload in the master")
+            return
+    except ImportError:
+        pass
+
+    server.log.info("Preloading models before forking workers")
+    app.warm_up(blocking=True)
+    # Move everything allocated so far out of the collector's view, so GC passes in the workers
+    # don't write to (and so copy) the shared pages
+    gc.freeze()
+    _preloaded = True
+    server.log.info(f"Models ready: {app.readiness()}")
+
+
+def post_fork(server, worker):
+    os.environ['TORCH_NUM_THREADS'] = str(WORKER_TORCH_THREADS)
+    try:
+        import torch
+        torch.set_num_threads(WORKER_TORCH_THREADS)
+    except ImportError:
+        pass
+
+    import cv2
+    cv2.setNumThreads(WORKER_OPENCV_THREADS)
+
+    import app
+    app.after_fork()
+    if not _preloaded:
+        # PRELOAD_MODELS suppressed the import-time warm-up, so without this /readyz would never pass
+        app.warm_up()
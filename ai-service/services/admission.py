@@ -0,0 +1,271 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from services.job_queue import process_alive
+
+MEMORY_BUDGET_MB = int(os.environ.get('MEMORY_BUDGET_MB', '2048'))
+# Ledger shared by the server workers and job processes on a host (empty keeps the budget per process)
+MEMORY_BUDGET_PATH = os.environ.get('MEMORY_BUDGET_PATH', 'temp/memory_budget.sqlite3')
+ADMISSION_TIMEOUT = float(os.environ.get('ADMISSION_TIMEOUT', '30'))
+# Pages above this are processed at a downscaled working resolution
+MAX_WORKING_PIXELS = int(os.environ.get('MAX_WORKING_PIXELS', str(16 * 1024 * 1024)))
+# Pages above this are rejected outright
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', str(100 * 1000 * 1000)))
+
+# Rough number of BGR frames alive at once: at full size the decoded page, inpaint tiles/masks, label
+# tiles and the encode buffer; when downscaled, the full-size original and composite plus working copies
+FULL_RES_COPIES = 4
+DOWNSCALED_FULL_RES_COPIES = 2
+WORKING_COPIES = 4
+
+
+class AdmissionError(Exception):
+    """A page that can't be admitted; status is 413 if it never fits, 503 if the budget is busy"""
+
+    def __init__(self, message: str, status: int = 503, retry_after: int = 5):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def image_dimensions(data: bytes) -> Tuple[int, int]:
+    """(width, height) from the image header, without decoding the pixels"""
+    try:
+        with warnings.catch_warnings():
+            # Pillow warns about large images on open; the pixel cap below is what applies here
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(BytesIO(data)) as image:
+                return image.size
+    except Image.DecompressionBombError:
+        raise AdmissionError("Image has too many pixels to process", status=413)
+    except Exception:
+        raise Exception("Could not decode image")
+
+
+def check_pixels(width: int, height: int):
+    if width * height > MAX_IMAGE_PIXELS:
+        raise AdmissionError(
+            f"Image is {width}x{height}; at most {MAX_IMAGE_PIXELS // 1000000} megapixels are supported", status=413
+        )
+
+
+def working_scale(width: int, height: int, max_pixels: int = MAX_WORKING_PIXELS) -> float:
+    pixels = width * height
+    return 1.0 if pixels <= max_pixels else math.sqrt(max_pixels / pixels)
+
+
+def estimate_page_bytes(width: int, height: int, max_pixels: int = MAX_WORKING_PIXELS) -> int:
+    """Peak memory a page is expected to need while it moves through the pipeline"""
+    full = width * height * 3
+    scale = working_scale(width, height, max_pixels)
+    if scale >= 1:
+        return full * FULL_RES_COPIES
+    return int(full * DOWNSCALED_FULL_RES_COPIES + full * scale * scale * WORKING_COPIES)
+
+
+class MemoryLedger:
+    """Reservations in SQLite, so every server worker and job process on a host draws on one budget
+
+    Each row belongs to the process that made it; rows of processes that no longer exist are
+    dropped, so a crashed worker doesn't hold its pages' memory forever.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connect()
+
+    def reopen(self):
+        """Reconnect after fork(); a SQLite connection must not be used by two processes"""
+        self._lock = threading.Lock()
+        self._connect()
+
+    def try_reserve(self, nbytes: int, limit_bytes: int) -> Optional[int]:
+        """Record a reservation if it fits under limit_bytes; returns its id, or None when it doesn't fit"""
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so the sum and the insert can't interleave
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._drop_dead_owners()
+                used = self._db.execute('SELECT COALESCE(SUM(nbytes), 0) FROM reservations').fetchone()[0]
+                if used + nbytes > limit_bytes:
+                    self._db.execute('COMMIT')
+                    return None
+                reservation = self._db.execute('INSERT INTO reservations (owner, nbytes) VALUES (?, ?)',
+                                               (os.getpid(), nbytes)).lastrowid
+                self._db.execute('COMMIT')
+                return reservation
+            except sqlite3.Error:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def release(self, reservation: int):
+        with self._lock:
+            self._db.execute('DELETE FROM reservations WHERE id = ?', (reservation,))
+
+    def used_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(nbytes), 0) FROM reservations').fetchone()[0]
+
+    def _drop_dead_owners(self):
+        owners = [owner for owner, in self._db.execute('SELECT DISTINCT owner FROM reservations').fetchall()]
+        for owner in owners:
+            if not process_alive(owner):
+                self._db.execute('DELETE FROM reservations WHERE owner = ?', (owner,))
+
+    def _connect(self):
+        # Autocommit; try_reserve manages its own transaction
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS reservations ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, owner INTEGER NOT NULL, nbytes INTEGER NOT NULL)'
+        )
+
+
+class MemoryBudget:
+    """Memory budget for pages in flight; pages reserve their estimate and wait for room or are rejected
+
+    With a ledger the budget is shared by every process using the same file; without one it
+    covers this process only.
+    """
+
+    def __init__(self, limit_bytes: int = MEMORY_BUDGET_MB * 1024 * 1024, timeout: float = ADMISSION_TIMEOUT,
+                 ledger: Optional[MemoryLedger] = None, poll_interval: float = 0.25):
+        self.limit_bytes = limit_bytes
+        self.timeout = timeout
+        self.ledger = ledger
+        self.poll_interval = poll_interval
+        self.used_bytes = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+
+    def reopen(self):
+        """Reset per-process state after fork()"""
+        self._condition = threading.Condition()
+        if self.ledger is not None:
+            self.ledger.reopen()
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        if nbytes > self.limit_bytes:
+            with self._condition:
+                self.rejected += 1
+            raise AdmissionError(
+                f"Page needs about {nbytes // (1024 * 1024)} MB, more than the "
+                f"{self.limit_bytes // (1024 * 1024)} MB memory budget", status=413
+            )
+
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            self.waiting += 1
+            try:
+                while True:
+                    reservation = self._try_reserve(nbytes)
+                    if reservation is not False:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionError("Server is busy with other large pages; try again shortly")
+                    # Releases in this process wake the wait early; other processes' are seen by polling
+                    self._condition.wait(remaining if self.ledger is None else min(remaining, self.poll_interval))
+            finally:
+                self.waiting -= 1
+            self.used_bytes += nbytes
+            self.in_flight += 1
+
+        try:
+            yield
+        finally:
+            if reservation is not None:
+                try:
+                    self.ledger.release(reservation)
+                except sqlite3.Error as e:
+                    print(f"Memory ledger release error: {e}")
+            with self._condition:
+                self.used_bytes -= nbytes
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        shared = None
+        if self.ledger is not None:
+            try:
+                shared = self.ledger.used_bytes()
+            except sqlite3.Error:
+                pass
+        with self._condition:
+            return {
+                'limitBytes': self.limit_bytes,
+                'usedBytes': self.used_bytes,
+                'sharedUsedBytes': shared,
+                'inFlight': self.in_flight,
+                'waiting': self.waiting,
+                'rejected': self.rejected
+            }
+
+    def _try_reserve(self, nbytes: int):
+        """Ledger reservation id (None without a ledger) if the page fits now, else False; holds the condition"""
+        if self.used_bytes + nbytes > self.limit_bytes:
+            return False
+        if self.ledger is None:
+            return None
+        try:
+            reservation = self.ledger.try_reserve(nbytes, self.limit_bytes)
+        except sqlite3.Error as e:
+            # Admission still holds per process if the shared file is unusable
+            print(f"Memory ledger error: {e}")
+            return None
+        return False if reservation is None else reservation
+
+
+def to_working_resolution(image: np.ndarray, max_pixels: int = MAX_WORKING_PIXELS) -> Tuple[np.ndarray, float]:
+    """Downscaled copy of an oversized page and its scale; the page itself when it already fits"""
+    height, width = image.shape[:2]
+    scale = working_scale(width, height, max_pixels)
+    if scale >= 1:
+        return image, 1.0
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+
+def upscale_changes(original: np.ndarray, before: np.ndarray, after: np.ndarray, scale: float,
+                    padding: int = 4, max_changed: float = 0.5) -> np.ndarray:
+    """Paste the regions that changed at working resolution back into the full-size original
+
+    Untouched artwork keeps its original pixels; if most of the page changed (e.g. colorization),
+    or a stage returned a different size (img2img rounds down to multiples of 8), the whole working
+    result is upscaled instead.
+    """
+    full_height, full_width = original.shape[:2]
+    if after.shape != before.shape:
+        return cv2.resize(after, (full_width, full_height), interpolation=cv2.INTER_CUBIC)
+    changed = (cv2.absdiff(before, after).max(axis=2) > 0).astype(np.uint8)
+    if changed.mean() > max_changed:
+        return cv2.resize(after, (full_width, full_height), interpolation=cv2.INTER_CUBIC)
+
+    changed = cv2.dilate(changed, np.ones((3, 3), np.uint8), iterations=padding)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(changed)
+    for x, y, w, h, _ in stats[1:count]:
+        x0, y0 = int(x / scale), int(y / scale)
+        x1, y1 = min(full_width, int(math.ceil((x + w) / scale))), min(full_height, int(math.ceil((y + h) / scale)))
+        if x1 > x0 and y1 > y0:
+            original[y0:y1, x0:x1] = cv2.resize(after[y:y + h, x:x + w], (x1 - x0, y1 - y0),
+                                                interpolation=cv2.INTER_CUBIC)
+    return original
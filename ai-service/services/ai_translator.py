@@ -1,18 +1,32 @@
-import openai
-import requests
+import os
 import base64
 from io import BytesIO
 from PIL import Image
 import numpy as np
 import cv2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from services.translation_cache import TranslationCache, get_shared_cache
+from services.inpainting import inpaint_regions
+from services.text_renderer import get_font_manager
+from services.layout import bbox_array, box_geometry, resolve_overlaps
+from services.http_client import ProviderClient
+from services.translators import OpenAIBackend, create_translation_service
+
+HF_BASE_URL = os.environ.get('HF_BASE_URL', 'https://api-inference.huggingface.co')
 
 class AITranslator:
-    def __init__(self, openai_api_key: str, hugging_face_api_key: str):
+    def __init__(self, openai_api_key: str, hugging_face_api_key: str, translation_cache: Optional[TranslationCache] = None):
         self.openai_api_key = openai_api_key
+        self.translation_cache = translation_cache or get_shared_cache()
+        self.fonts = get_font_manager()
         self.hf_api_key = hugging_face_api_key
-        openai.api_key = openai_api_key
         self.hf_headers = {"Authorization": f"Bearer {hugging_face_api_key}"}
+        self.openai = OpenAIBackend(openai_api_key)
+        self.hf = ProviderClient.from_env('hf', headers=self.hf_headers, max_concurrency=2, timeout=120)
+        self.translators = create_translation_service(
+            self.translation_cache, openai_backend=self.openai,
+            default=os.environ.get('AI_TRANSLATION_BACKEND', 'openai')
+        )
 
     def extract_text_with_vision(self, image_path: str) -> List[Dict[str, Any]]:
         """Use OpenAI Vision API for advanced text detection"""
@@ -20,9 +34,9 @@ class AITranslator:
             with open(image_path, "rb") as image_file:
                 image_data = base64.b64encode(image_file.read()).decode()
 
-            response = openai.chat.completions.create(
-                model="gpt-4-vision-preview",
-                messages=[
+            content = self.openai.chat(
+                "gpt-4-vision-preview",
+                [
                     {
                         "role": "user",
                         "content": [
@@ -42,8 +56,6 @@ class AITranslator:
                 max_tokens=1000
             )
 
-            # Parse the structured response
-            content = response.choices[0].message.content
             # Process and structure the text extraction results
             return self._parse_vision_response(content)
 
@@ -51,30 +63,15 @@ class AITranslator:
             print(f"Vision API error: {e}")
             return []
 
-    def translate_text_contextual(self, text: str, target_lang: str, context: str = "manga") -> str:
-        """Contextual translation using GPT-4"""
-        try:
-            response = openai.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"You are a professional manga translator. Translate the following text to {target_lang}, preserving the tone, cultural context, and character voice. Consider manga conventions and keep translations concise to fit speech bubbles."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Translate this {context} text: '{text}'"
-                    }
-                ],
-                max_tokens=200,
-                temperature=0.3
-            )
-
-            return response.choices[0].message.content.strip()
+    def translate_text_contextual(self, text: str, target_lang: str, context: str = "manga",
+                                  backend: Optional[str] = None) -> str:
+        """Contextual translation, using GPT-4 unless another backend is selected"""
+        return self.translators.translate([text], target_lang, backend, context=context)[0]
 
-        except Exception as e:
-            print(f"Translation error: {e}")
-            return text
+    def translate_batch_contextual(self, texts: List[str], target_lang: str, context: str = "manga",
+                                   backend: Optional[str] = None) -> List[str]:
+        """Translate all texts of a page in one backend call; GPT-4 splits it into concurrent numbered requests"""
+        return self.translators.translate(texts, target_lang, backend, context=context)
 
     def colorize_manga(self, image_path: str, style: str = "anime") -> str:
         """AI-powered manga colorization"""
@@ -88,7 +85,7 @@ class AITranslator:
             img_str = base64.b64encode(buffered.getvalue()).decode()
 
             # Use Hugging Face Stable Diffusion for colorization
-            api_url = "https://api-inference.huggingface.co/models/runwayml/stable-diffusion-v1-5"
+            api_url = f"{HF_BASE_URL}/models/runwayml/stable-diffusion-v1-5"
             
             prompt = f"colorful {style} style manga artwork, vibrant colors, detailed illustration, high quality"
             
@@ -101,7 +98,7 @@ class AITranslator:
                 }
             }
 
-            response = requests.post(api_url, headers=self.hf_headers, json=payload)
+            response = self.hf.post(api_url, json=payload)
             
             if response.status_code == 200:
                 # Save colorized image
@@ -121,19 +118,9 @@ class AITranslator:
         """Advanced text removal using AI inpainting"""
         try:
             image = cv2.imread(image_path)
-            
-            # Create mask for text areas
-            mask = np.zeros(image.shape[:2], dtype=np.uint8)
-            
-            for area in text_areas:
-                if 'bbox' in area:
-                    bbox = area['bbox']
-                    # Convert bbox to polygon and fill
-                    points = np.array(bbox, dtype=np.int32)
-                    cv2.fillPoly(mask, [points], 255)
-
-            # Use OpenCV's advanced inpainting
-            result = cv2.inpaint(image, mask, inpaintRadius=7, flags=cv2.INPAINT_TELEA)
+
+            # Inpaint only the padded regions around the text, not the whole page
+            result = inpaint_regions(image, text_areas, radius=7, flags=cv2.INPAINT_TELEA)
             
             # Save result
             output_path = image_path.replace('.', '_cleaned.')
@@ -145,34 +132,37 @@ class AITranslator:
             print(f"Text removal error: {e}")
             return image_path
 
-    def add_translated_text_smart(self, image_path: str, text_areas: List[Dict], target_lang: str) -> str:
+    def add_translated_text_smart(self, image_path: str, text_areas: List[Dict], target_lang: str,
+                                  backend: Optional[str] = None) -> str:
         """Smart text placement with font matching"""
         try:
             image = Image.open(image_path)
             
             # Use PIL for better text rendering
-            from PIL import ImageDraw, ImageFont
+            from PIL import ImageDraw
             
             draw = ImageDraw.Draw(image)
             
             # Load appropriate fonts for different languages
             font_path = self._get_font_for_language(target_lang)
             
-            for area in text_areas:
-                original_text = area.get('text', '')
-                translated_text = self.translate_text_contextual(original_text, target_lang)
-                
-                # Calculate optimal font size and position
-                bbox = area.get('bbox', [])
-                if len(bbox) >= 4:
-                    optimal_font_size = self._calculate_font_size(translated_text, bbox)
-                    font = ImageFont.truetype(font_path, optimal_font_size)
-                    
-                    # Smart text positioning
-                    x, y = self._calculate_text_position(translated_text, bbox, font)
-                    
-                    # Add text with outline for readability
-                    self._draw_text_with_outline(draw, (x, y), translated_text, font)
+            translations = self.translate_batch_contextual(
+                [area.get('text', '') for area in text_areas], target_lang, backend=backend
+            )
+
+            placed = [(area['bbox'], text) for area, text in zip(text_areas, translations)
+                      if len(area.get('bbox', [])) >= 4]
+            bboxes = [bbox for bbox, _ in placed]
+            
+            # Fit each translation to its area; the wrapped lines are what gets drawn
+            fitted = [self._fit_text(text, bbox, font_path) for bbox, text in placed]
+            
+            # Smart text positioning
+            positions = self._calculate_text_positions(fitted, bboxes, image.size)
+            
+            for (font, lines, line_height), position in zip(fitted, positions):
+                # Add text with outline for readability
+                self._draw_lines_with_outline(draw, position, lines, line_height, font)
 
             # Save result
             output_path = image_path.replace('.', '_translated.')
@@ -204,15 +194,32 @@ class AITranslator:
         }
         return font_map.get(target_lang, '/usr/share/fonts/arial.ttf')
 
-    def _calculate_font_size(self, text: str, bbox: List) -> int:
-        """Calculate optimal font size for given text and bounding box"""
-        # Implementation for font size calculation
-        return 20  # Default size
+    def _fit_text(self, text: str, bbox: List, font_path: Optional[str] = None) -> tuple:
+        """Largest font (10-40pt) whose wrapped text fits the box; returns (font, lines, line height)"""
+        width, height = box_geometry(bbox_array([{'bbox': bbox}]))['extents'][0]
+        return self.fonts.fit_text(text, font_path, width, height, min_size=10, max_size=40)
 
-    def _calculate_text_position(self, text: str, bbox: List, font) -> tuple:
-        """Calculate optimal text position within bounding box"""
-        # Implementation for text positioning
-        return (bbox[0][0], bbox[0][1])
+    def _calculate_text_positions(self, fitted: List[tuple], bboxes: List, page_size: tuple) -> List[tuple]:
+        """Top-left corners centering each block of lines in its box, with overlapping blocks moved apart"""
+        if not fitted:
+            return []
+        
+        geometry = box_geometry(bbox_array([{'bbox': bbox} for bbox in bboxes]))
+        # The outline adds a pixel on every side
+        extents = np.array([(max(width for _, width in lines), len(lines) * line_height)
+                            for _, lines, line_height in fitted], dtype=np.float64) + 2
+        
+        centers = resolve_overlaps(geometry['centers'], extents, page_size)
+        origins = centers - extents / 2 + 1
+        return [(float(x), float(y)) for x, y in origins]
+
+    def _draw_lines_with_outline(self, draw, position, lines, line_height, font):
+        """Draw wrapped lines centered under each other, each with an outline"""
+        x, y = position
+        block_width = max(width for _, width in lines)
+        for i, (line, width) in enumerate(lines):
+            origin = (int(round(x + (block_width - width) / 2)), int(round(y + i * line_height)))
+            self._draw_text_with_outline(draw, origin, line, font)
 
     def _draw_text_with_outline(self, draw, position, text, font):
         """Draw text with outline for better readability"""
@@ -0,0 +1,241 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp'}
+MIME_TYPES = {extension: mime_type for mime_type, extension in EXTENSIONS.items()}
+
+_ARTIFACT_ID = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ArtifactStore:
+    """Content-addressed files for downloads and outputs, capped in size with LRU eviction
+
+    An artifact's id is the SHA-256 of its bytes, so identical outputs share one file and ids are
+    stable across restarts. Downloaded URLs map to the artifact holding their bytes for url_ttl seconds.
+    Several worker processes can share a directory: each rescans it every sweep_interval seconds, so
+    the LRU order (file mtimes) and the size cap apply to what all of them wrote.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None,
+                 url_ttl: Optional[float] = None, sweep_interval: Optional[float] = None):
+        self.directory = directory if directory is not None else os.environ.get('ARTIFACT_DIR', 'temp/artifacts')
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.environ.get('ARTIFACT_MAX_MB', '1024')) * 1024 * 1024
+        self.url_ttl = url_ttl if url_ttl is not None else float(os.environ.get('ARTIFACT_URL_TTL', '86400'))
+        self.sweep_interval = sweep_interval if sweep_interval is not None else float(
+            os.environ.get('ARTIFACT_SWEEP_INTERVAL', '60'))
+        self.url_hits = 0
+        self.url_misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+        os.makedirs(os.path.join(self.directory, 'urls'), exist_ok=True)
+        self.sweep()
+
+    def put(self, data: bytes, mime_type: str) -> Dict[str, Any]:
+        """Store bytes under their content hash; writing the same bytes again only refreshes them"""
+        artifact_id = hashlib.sha256(data).hexdigest()
+        path = self._path(artifact_id, EXTENSIONS.get(mime_type, '.bin'))
+
+        with self._lock:
+            known = artifact_id in self._index
+        if known and os.path.exists(path):
+            self._touch(artifact_id, path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A per-writer temp name keeps concurrent writers of the same artifact from clobbering each other
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+            with self._lock:
+                if artifact_id not in self._index:
+                    self.total_bytes += len(data)
+                self._index[artifact_id] = (path, len(data))
+                self._index.move_to_end(artifact_id)
+                self._evict(keep=artifact_id)
+
+        if time.time() - self._last_sweep > self.sweep_interval:
+            self.sweep()
+        return self._describe(artifact_id, path, len(data))
+
+    def get(self, artifact_id: str) -> Optional[Dict[str, Any]]:
+        """Look up an artifact by id, marking it recently used"""
+        if not _ARTIFACT_ID.match(artifact_id or ''):
+            return None
+        with self._lock:
+            entry = self._index.get(artifact_id)
+        if entry is None:
+            # Possibly written by another worker since this one last swept
+            entry = self._find(artifact_id)
+            if entry is None:
+                return None
+
+        path, size = entry
+        if not os.path.exists(path):
+            with self._lock:
+                self._remove(artifact_id)
+            return None
+        self._touch(artifact_id, path)
+        return self._describe(artifact_id, path, size)
+
+    def read(self, artifact: Dict[str, Any]) -> Optional[bytes]:
+        try:
+            with open(artifact['path'], 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def remember_url(self, url: str, artifact_id: str):
+        """Point a URL at the artifact holding its downloaded bytes"""
+        ref_path = self._url_path(url)
+        temp_path = f"{ref_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(artifact_id)
+            os.replace(temp_path, ref_path)
+        except OSError as e:
+            print(f"Artifact store URL write error: {e}")
+
+    def lookup_url(self, url: str) -> Optional[Dict[str, Any]]:
+        """The artifact downloaded from a URL within url_ttl, if it is still stored"""
+        ref_path = self._url_path(url)
+        artifact = None
+        try:
+            if time.time() - os.path.getmtime(ref_path) <= self.url_ttl:
+                with open(ref_path) as f:
+                    artifact = self.get(f.read().strip())
+            else:
+                os.remove(ref_path)
+        except OSError:
+            pass
+
+        with self._lock:
+            if artifact is None:
+                self.url_misses += 1
+            else:
+                self.url_hits += 1
+        return artifact
+
+    def sweep_urls(self) -> int:
+        """Delete expired URL references; artifacts themselves are evicted by size on put"""
+        removed = 0
+        url_dir = os.path.join(self.directory, 'urls')
+        now = time.time()
+        for name in os.listdir(url_dir):
+            path = os.path.join(url_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.url_ttl:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def sweep(self):
+        """Rescan the directory, evict least recently used artifacts down to the cap and drop expired URLs"""
+        self._last_sweep = time.time()
+        entries = self._scan()
+        with self._lock:
+            self._index = OrderedDict((artifact_id, (path, size)) for _, artifact_id, path, size in entries)
+            self.total_bytes = sum(size for _, _, _, size in entries)
+            self._evict(keep='')
+        self.sweep_urls()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'hits': self.url_hits,
+                'misses': self.url_misses,
+                'evictions': self.evictions,
+                'entries': len(self._index),
+                'bytes': self.total_bytes,
+                'maxBytes': self.max_bytes
+            }
+
+    def _describe(self, artifact_id: str, path: str, size: int) -> Dict[str, Any]:
+        return {
+            'id': artifact_id,
+            'path': path,
+            'mimeType': MIME_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream'),
+            'size': size
+        }
+
+    def _path(self, artifact_id: str, extension: str) -> str:
+        # Two levels of sharding keep directories small under sustained load
+        return os.path.join(self.directory, artifact_id[:2], artifact_id[2:4], artifact_id + extension)
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self.directory, 'urls', hashlib.sha256(url.encode()).hexdigest())
+
+    def _find(self, artifact_id: str):
+        for extension in list(EXTENSIONS.values()) + ['.bin']:
+            path = self._path(artifact_id, extension)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            with self._lock:
+                if artifact_id not in self._index:
+                    self.total_bytes += size
+                self._index[artifact_id] = (path, size)
+            return path, size
+        return None
+
+    def _touch(self, artifact_id: str, path: str):
+        with self._lock:
+            if artifact_id in self._index:
+                self._index.move_to_end(artifact_id)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict(self, keep: str):
+        while self.total_bytes > self.max_bytes and len(self._index) > 1:
+            oldest = next(iter(self._index))
+            if oldest == keep:
+                self._index.move_to_end(oldest)
+                continue
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, artifact_id: str):
+        path, size = self._index.pop(artifact_id, (None, 0))
+        self.total_bytes -= size
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _scan(self):
+        """(mtime, id, path, size) of every stored artifact, oldest first; removes leftovers of interrupted writes"""
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            if os.path.basename(root) == 'urls':
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                artifact_id, extension = os.path.splitext(name)
+                try:
+                    if extension == '.tmp':
+                        # Only stale ones, a concurrent writer may still be filling a fresh one
+                        if time.time() - os.path.getmtime(path) > 3600:
+                            os.remove(path)
+                        continue
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if _ARTIFACT_ID.match(artifact_id):
+                    entries.append((stat.st_mtime, artifact_id, path, stat.st_size))
+        return sorted(entries)
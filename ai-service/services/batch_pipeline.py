@@ -0,0 +1,99 @@
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_DONE = object()
+
+
+class PagePipeline:
+    def __init__(self, stages: List[Tuple[str, Callable[[Dict[str, Any]], Dict[str, Any]]]], queue_size: int = 2,
+                 on_discard: Optional[Callable[[Dict[str, Any]], None]] = None, poll_interval: float = 0.5):
+        self.stages = stages
+        self.queue_size = queue_size
+        # Called for pages dropped unfinished when the consumer stops early, e.g. to release their resources
+        self.on_discard = on_discard
+        self.poll_interval = poll_interval
+
+    def run(self, pages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Run pages through the stages, one thread per stage, yielding each page as it finishes
+
+        If the consumer stops early (a client disconnect closes the generator), the stage threads
+        are told to stop and the queues are drained so none stays blocked on a full queue.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        threads = []
+
+        for i, (name, fn) in enumerate(self.stages):
+            thread = threading.Thread(
+                target=self._stage_worker,
+                args=(name, fn, queues[i], queues[i + 1], stop),
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+
+        feeder = threading.Thread(target=self._feed, args=(pages, queues[0], stop), daemon=True)
+        feeder.start()
+        threads.append(feeder)
+
+        try:
+            while True:
+                page = queues[-1].get()
+                if page is _DONE:
+                    break
+                yield page
+        finally:
+            stop.set()
+            # Keep emptying until every thread has seen the stop, since each may still put one item
+            while any(thread.is_alive() for thread in threads):
+                self._drain(queues)
+                for thread in threads:
+                    thread.join(self.poll_interval)
+            self._drain(queues)
+
+    def _drain(self, queues: List[queue.Queue]):
+        for q in queues:
+            while True:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _DONE and self.on_discard is not None:
+                    self.on_discard(item)
+
+    def _put(self, out_queue: queue.Queue, item: Any, stop: threading.Event) -> bool:
+        """Put unless stopped first; False means the item was not queued"""
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self, pages: Iterable[Dict[str, Any]], out_queue: queue.Queue, stop: threading.Event):
+        for index, page in enumerate(pages):
+            if not self._put(out_queue, {'index': index, 'page': page}, stop):
+                return
+        self._put(out_queue, _DONE, stop)
+
+    def _stage_worker(self, name: str, fn: Callable, in_queue: queue.Queue, out_queue: queue.Queue,
+                      stop: threading.Event):
+        while not stop.is_set():
+            try:
+                item = in_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                self._put(out_queue, _DONE, stop)
+                return
+
+            # A failed page skips the remaining stages but still flows to the output
+            if 'error' not in item:
+                try:
+                    item = fn(item)
+                except Exception as e:
+                    item['error'] = f"{name} failed: {str(e)}"
+            if not self._put(out_queue, item, stop) and self.on_discard is not None:
+                self.on_discard(item)
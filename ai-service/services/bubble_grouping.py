@@ -0,0 +1,145 @@
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from services.layout import bbox_array, box_geometry
+
+# Scripts written without spaces between words (CJK punctuation, kana, Han, fullwidth forms);
+# fragments meeting on these characters are joined directly, anything else gets a space
+NO_SPACE_RANGES = ((0x3000, 0x30FF), (0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0xFF00, 0xFFEF))
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+class GridIndex:
+    """Uniform grid over bounding boxes, so neighbour lookups stay close to linear on dense pages"""
+
+    def __init__(self, cell_size: float):
+        self.cell_size = max(cell_size, 1.0)
+        self._cells = defaultdict(list)
+
+    def _cells_for(self, rect: Tuple[float, float, float, float]):
+        x0, y0, x1, y1 = (int(v // self.cell_size) for v in rect)
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                yield cx, cy
+
+    def insert(self, index: int, rect: Tuple[float, float, float, float]):
+        for cell in self._cells_for(rect):
+            self._cells[cell].append(index)
+
+    def query(self, rect: Tuple[float, float, float, float]) -> set:
+        found = set()
+        for cell in self._cells_for(rect):
+            found.update(self._cells.get(cell, ()))
+        return found
+
+
+def _rects(text_areas: List[Dict]) -> np.ndarray:
+    return box_geometry(bbox_array(text_areas))['bounds']
+
+
+def _no_space(char: str) -> bool:
+    code = ord(char)
+    return any(low <= code <= high for low, high in NO_SPACE_RANGES)
+
+
+def join_fragments(texts: List[str]) -> str:
+    """Join fragments in reading order, with a space only where one side isn't a no-space script
+
+    Decided per boundary rather than per request, so Latin or Korean lines on a Japanese page (or a
+    request with sourceLanguage 'auto') keep their word breaks.
+    """
+    joined = ''
+    for text in texts:
+        text = text.strip()
+        if not text:
+            continue
+        if joined and not (_no_space(joined[-1]) and _no_space(text[0])):
+            joined += ' '
+        joined += text
+    return joined
+
+
+def _reading_order(rects: np.ndarray, members: List[int], vertical: bool) -> List[int]:
+    if vertical:
+        # Vertical manga text: columns right to left, each column top to bottom
+        width = np.median(rects[members, 2] - rects[members, 0])
+        return sorted(members, key=lambda i: (-round(((rects[i, 0] + rects[i, 2]) / 2) / max(width, 1)), rects[i, 1]))
+    height = np.median(rects[members, 3] - rects[members, 1])
+    return sorted(members, key=lambda i: (round(((rects[i, 1] + rects[i, 3]) / 2) / max(height, 1)), rects[i, 0]))
+
+
+def group_text_areas(text_areas: List[Dict], gap_ratio: float = 0.6) -> List[Dict]:
+    """Cluster OCR line fragments into speech bubbles, keeping the text_areas dict format"""
+    if len(text_areas) < 2:
+        return text_areas
+
+    rects = _rects(text_areas)
+    widths = rects[:, 2] - rects[:, 0]
+    heights = rects[:, 3] - rects[:, 1]
+    # The short side of a line fragment approximates the glyph size for both orientations
+    glyph = np.minimum(widths, heights)
+    gaps = gap_ratio * glyph
+
+    index = GridIndex(2 * float(np.median(glyph)) + float(gaps.max()))
+    for i, rect in enumerate(rects):
+        index.insert(i, tuple(rect))
+
+    groups = _UnionFind(len(text_areas))
+    for i, rect in enumerate(rects):
+        gap = gaps[i]
+        expanded = (rect[0] - gap, rect[1] - gap, rect[2] + gap, rect[3] + gap)
+        for j in index.query(expanded):
+            if j <= i:
+                continue
+            limit = min(gap, gaps[j])
+            if (rects[j, 0] - rect[2] <= limit and rect[0] - rects[j, 2] <= limit and
+                    rects[j, 1] - rect[3] <= limit and rect[1] - rects[j, 3] <= limit and
+                    max(glyph[i], glyph[j]) <= 2 * min(glyph[i], glyph[j])):
+                groups.union(i, j)
+
+    clusters = defaultdict(list)
+    for i in range(len(text_areas)):
+        clusters[groups.find(i)].append(i)
+
+    bubbles = []
+    for members in clusters.values():
+        if len(members) == 1:
+            bubbles.append(text_areas[members[0]])
+            continue
+
+        vertical = bool(np.sum(heights[members] > 1.5 * widths[members]) * 2 > len(members))
+        ordered = _reading_order(rects, members, vertical)
+        x0, y0 = int(rects[members, 0].min()), int(rects[members, 1].min())
+        x1, y1 = int(np.ceil(rects[members, 2].max())), int(np.ceil(rects[members, 3].max()))
+        lengths = np.array([max(len(text_areas[i]['text']), 1) for i in ordered], dtype=np.float64)
+        confidences = np.array([text_areas[i]['confidence'] for i in ordered], dtype=np.float64)
+
+        bubbles.append({
+            'bbox': [[x0, y0], [x1, y0], [x1, y1], [x0, y1]],
+            'text': join_fragments([text_areas[i]['text'] for i in ordered]),
+            'confidence': float(np.average(confidences, weights=lengths)),
+            'fragments': [text_areas[i]['bbox'] for i in ordered],
+            'vertical': vertical
+        })
+
+    # Keep page order stable: top to bottom, then right to left as manga pages read
+    bubble_rects = _rects(bubbles)
+    order = sorted(range(len(bubbles)), key=lambda i: (bubble_rects[i, 1], -bubble_rects[i, 0]))
+    return [bubbles[i] for i in order]
@@ -0,0 +1,110 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Statuses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderClient:
+    """Pooled HTTP client for one upstream provider with bounded concurrency, rate limiting and retries"""
+
+    def __init__(self, name: str, max_concurrency: int = 4, rate: float = 0, timeout: float = 30,
+                 retries: int = 3, backoff: float = 0.5, headers: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = RateLimiter(rate)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{name}-http")
+
+        # Keep-alive connections are reused across calls; the pool matches the concurrency bound
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    @classmethod
+    def from_env(cls, name: str, headers: Optional[Dict[str, str]] = None, **defaults) -> 'ProviderClient':
+        """Build a client from <NAME>_MAX_CONCURRENCY, _RATE_LIMIT, _TIMEOUT and _RETRIES"""
+        prefix = name.upper()
+        return cls(
+            name,
+            max_concurrency=int(os.environ.get(f'{prefix}_MAX_CONCURRENCY', defaults.get('max_concurrency', 4))),
+            rate=float(os.environ.get(f'{prefix}_RATE_LIMIT', defaults.get('rate', 0))),
+            timeout=float(os.environ.get(f'{prefix}_TIMEOUT', defaults.get('timeout', 30))),
+            retries=int(os.environ.get(f'{prefix}_RETRIES', defaults.get('retries', 3))),
+            headers=headers
+        )
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """Send a request, retrying transient failures with full-jitter exponential backoff"""
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                with self._slots:
+                    response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries:
+                    raise Exception(f"{self.name} request failed after {attempt + 1} attempts: {e}")
+                delay = self._delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                delay = self._delay(attempt, response.headers.get('Retry-After'))
+
+            attempt += 1
+            time.sleep(delay)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def map(self, fn: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        """Run fn over items concurrently; the total time is roughly that of the slowest call"""
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        return list(self._executor.map(fn, items))
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, self.backoff * (2 ** attempt))
@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+Rect = Tuple[int, int, int, int]
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=int(os.environ.get('INPAINT_WORKERS', '4')))
+    return _executor
+
+
+def merge_regions(polygons: Sequence[np.ndarray], shape: Tuple[int, int], padding: int) -> List[Tuple[Rect, List[int]]]:
+    """Group polygons whose padded bounding boxes touch into non-overlapping tiles"""
+    height, width = shape
+    tiles = []
+    for index, polygon in enumerate(polygons):
+        x, y, w, h = cv2.boundingRect(polygon)
+        tiles.append(([max(0, x - padding), max(0, y - padding),
+                       min(width, x + w + padding), min(height, y + h + padding)], [index]))
+
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for rect, members in tiles:
+            for other in result:
+                other_rect = other[0]
+                if (rect[0] <= other_rect[2] and other_rect[0] <= rect[2] and
+                        rect[1] <= other_rect[3] and other_rect[1] <= rect[3]):
+                    other_rect[0] = min(other_rect[0], rect[0])
+                    other_rect[1] = min(other_rect[1], rect[1])
+                    other_rect[2] = max(other_rect[2], rect[2])
+                    other_rect[3] = max(other_rect[3], rect[3])
+                    other[1].extend(members)
+                    merged = True
+                    break
+            else:
+                result.append((rect, members))
+        tiles = result
+
+    return [(tuple(rect), members) for rect, members in tiles]
+
+
+def _flat_fill_color(tile: np.ndarray, mask: np.ndarray, max_std: float) -> Optional[np.ndarray]:
+    """Return the fill color if the pixels around the masked text are uniform"""
+    ring = cv2.dilate(mask, np.ones((5, 5), np.uint8), iterations=2)
+    ring[mask > 0] = 0
+    border = tile[ring > 0]
+    if len(border) < 16:
+        return None
+    if border.reshape(len(border), -1).std(axis=0).max() > max_std:
+        return None
+    return np.median(border, axis=0).astype(tile.dtype)
+
+
+def _inpaint_tile(image: np.ndarray, rect: Rect, polygons: List[np.ndarray],
+                  radius: int, flags: int, flat_std: float) -> Tuple[Rect, np.ndarray, bool]:
+    x0, y0, x1, y1 = rect
+    tile = image[y0:y1, x0:x1]
+    mask = np.zeros(tile.shape[:2], dtype=np.uint8)
+    cv2.fillPoly(mask, [polygon - np.array([x0, y0], dtype=np.int32) for polygon in polygons], 255)
+
+    fill = _flat_fill_color(tile, mask, flat_std) if flat_std > 0 else None
+    if fill is not None:
+        result = tile.copy()
+        result[mask > 0] = fill
+        return rect, result, True
+
+    return rect, cv2.inpaint(tile, mask, radius, flags), False
+
+
+def inpaint_regions(image: np.ndarray, text_areas: List[dict], radius: int = 3,
+                    flags: int = cv2.INPAINT_TELEA, padding: Optional[int] = None,
+                    flat_std: float = 6.0, in_place: bool = False) -> np.ndarray:
+    """Inpaint only padded tiles around the text areas instead of the full frame"""
+    # Grouped bubbles carry their original OCR fragments, which give a tighter mask than the union box
+    polygons = [np.array(bbox, dtype=np.int32).reshape(-1, 2)
+                for area in text_areas if 'bbox' in area
+                for bbox in area.get('fragments', [area['bbox']])]
+    result = image if in_place else image.copy()
+    if not polygons:
+        return result
+
+    # The tile must extend past the inpaint radius so it sees real context on every side
+    padding = padding if padding is not None else max(3 * radius, 12)
+    tiles = merge_regions(polygons, image.shape[:2], padding)
+
+    jobs = [(rect, [polygons[i] for i in members]) for rect, members in tiles]
+    if len(jobs) == 1:
+        outputs = [_inpaint_tile(image, jobs[0][0], jobs[0][1], radius, flags, flat_std)]
+    else:
+        outputs = _get_executor().map(
+            lambda job: _inpaint_tile(image, job[0], job[1], radius, flags, flat_std), jobs
+        )
+
+    for (x0, y0, x1, y1), tile, _ in outputs:
+        result[y0:y1, x0:x1] = tile
+
+    return result
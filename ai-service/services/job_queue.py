@@ -0,0 +1,309 @@
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+TERMINAL_STATES = ('done', 'failed')
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _worker_main(handler: Callable, task_queue, event_queue):
+    """Worker process loop; the handler's module (and its MangaProcessor) stays warm across jobs"""
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+
+        job_id, payload = task
+        event_queue.put((job_id, 'running', {'worker': multiprocessing.current_process().pid}))
+
+        def progress(stage, info=None):
+            event_queue.put((job_id, 'progress', {'stage': stage, **(info or {})}))
+
+        try:
+            result = handler(payload, progress)
+            event_queue.put((job_id, 'done', {'result': result}))
+        except Exception as e:
+            event_queue.put((job_id, 'failed', {'error': str(e)}))
+
+
+class JobStore:
+    """Job records in SQLite, so every server process can answer for jobs another one runs
+
+    Each record belongs to the process that accepted the job (owner); records of owners that
+    no longer exist are failed, so they stop counting against the pending limit.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connect()
+
+    def reopen(self):
+        """Reconnect after fork(); a SQLite connection must not be used by two processes"""
+        self._lock = threading.Lock()
+        self._connect()
+
+    def save(self, job: Dict[str, Any]):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, status, owner, updated_at, data) VALUES (?, ?, ?, ?, ?)',
+                (job['jobId'], job['status'], os.getpid(), job['updatedAt'], json.dumps(job))
+            )
+            self._db.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute('SELECT data FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def active(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM jobs WHERE status NOT IN (?, ?)',
+                                    TERMINAL_STATES).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def expire(self, cutoff: float):
+        """Delete finished jobs last updated before cutoff and fail jobs whose owner process is gone"""
+        with self._lock:
+            self._db.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?', (*TERMINAL_STATES, cutoff))
+            orphaned = [(job_id, data) for job_id, owner, data in self._db.execute(
+                'SELECT job_id, owner, data FROM jobs WHERE status NOT IN (?, ?)', TERMINAL_STATES
+            ).fetchall() if not process_alive(owner)]
+            for job_id, data in orphaned:
+                job = dict(json.loads(data), status='failed', error='Server process exited unexpectedly',
+                           updatedAt=time.time())
+                self._db.execute('UPDATE jobs SET status = ?, updated_at = ?, data = ? WHERE job_id = ?',
+                                 ('failed', job['updatedAt'], json.dumps(job), job_id))
+            self._db.commit()
+
+    def _connect(self):
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'job_id TEXT PRIMARY KEY, status TEXT NOT NULL, owner INTEGER NOT NULL, '
+            'updated_at REAL NOT NULL, data TEXT NOT NULL)'
+        )
+        self._db.commit()
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """Runs jobs in spawned worker processes owned by this server process
+
+    With a store, job records are shared, so any server process can report a job's status and
+    result and the pending limit applies to all of them together.
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any], Callable], Dict[str, Any]],
+                 num_workers: int = 2, max_pending: int = 32, result_ttl: float = 600,
+                 store: Optional[JobStore] = None, poll_interval: float = 0.25):
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.store = store
+        self.poll_interval = poll_interval
+        self._context = multiprocessing.get_context('spawn')
+        self._task_queue = None
+        self._event_queue = None
+        self._workers: List[Any] = []
+        self._jobs = {}
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._started = False
+
+    def start(self):
+        with self._condition:
+            if self._started:
+                return
+            self._started = True
+            # Created on first use rather than at import, so each forked server process gets its own queues
+            self._task_queue = self._context.Queue()
+            self._event_queue = self._context.Queue()
+
+        for _ in range(self.num_workers):
+            self._spawn_worker()
+        threading.Thread(target=self._collect_events, daemon=True).start()
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        """Queue a job and return its id, or raise QueueFullError when the queue is at capacity"""
+        self.start()
+        job_id = uuid.uuid4().hex
+
+        with self._condition:
+            pending = self.store.active() if self.store is not None else self._pending
+            if pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+            self._pending += 1
+            job = self._jobs[job_id] = {
+                'jobId': job_id,
+                'status': 'queued',
+                'stage': None,
+                'progress': None,
+                'createdAt': time.time(),
+                'updatedAt': time.time(),
+                'result': None,
+                'error': None,
+                'worker': None
+            }
+            self._save(job)
+
+        self._task_queue.put((job_id, payload))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        return self.store.get(job_id) if self.store is not None else None
+
+    def wait(self, job_id: str, last_updated: float = 0, timeout: float = 30) -> Optional[Dict[str, Any]]:
+        """Block until the job changes after last_updated, finishes, or the timeout passes"""
+        deadline = time.time() + timeout
+        with self._condition:
+            local = job_id in self._jobs
+        if not local and self.store is not None:
+            return self._poll(job_id, last_updated, deadline)
+
+        with self._condition:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job['updatedAt'] > last_updated or job['status'] in TERMINAL_STATES:
+                    return dict(job) if job is not None else None
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return dict(job)
+                self._condition.wait(remaining)
+
+    def stats(self) -> Dict[str, Any]:
+        if self.store is not None:
+            counts = self.store.counts()
+            pending = self.store.active()
+        with self._condition:
+            if self.store is None:
+                counts = {}
+                for job in self._jobs.values():
+                    counts[job['status']] = counts.get(job['status'], 0) + 1
+                pending = self._pending
+            return {
+                'workers': sum(1 for worker in self._workers if worker.is_alive()),
+                'pending': pending,
+                'maxPending': self.max_pending,
+                'jobs': counts
+            }
+
+    def reopen(self):
+        """Reset per-process state after fork(); workers and queues are created on first use"""
+        self._condition = threading.Condition()
+        if self.store is not None:
+            self.store.reopen()
+
+    def _poll(self, job_id: str, last_updated: float, deadline: float) -> Optional[Dict[str, Any]]:
+        """wait() for a job another server process owns, by re-reading the store"""
+        while True:
+            job = self.store.get(job_id)
+            if job is None or job['updatedAt'] > last_updated or job['status'] in TERMINAL_STATES:
+                return job
+            if time.time() >= deadline:
+                return job
+            time.sleep(self.poll_interval)
+
+    def _save(self, job: Dict[str, Any]):
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except sqlite3.Error as e:
+            print(f"Job store write error: {e}")
+
+    def _spawn_worker(self):
+        worker = self._context.Process(
+            target=_worker_main,
+            args=(self.handler, self._task_queue, self._event_queue),
+            daemon=True
+        )
+        worker.start()
+        self._workers.append(worker)
+
+    def _collect_events(self):
+        last_check = time.time()
+        while True:
+            if time.time() - last_check >= 1:
+                self._check_workers()
+                self._expire_jobs()
+                last_check = time.time()
+
+            try:
+                job_id, status, info = self._event_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            with self._condition:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                if status == 'progress':
+                    job['stage'] = info.pop('stage')
+                    job['progress'] = info
+                else:
+                    if status in TERMINAL_STATES and job['status'] not in TERMINAL_STATES:
+                        self._pending -= 1
+                    job['status'] = status
+                    job.update(info)
+                job['updatedAt'] = time.time()
+                self._save(job)
+                self._condition.notify_all()
+
+    def _check_workers(self):
+        for worker in list(self._workers):
+            if worker.is_alive():
+                continue
+            self._workers.remove(worker)
+            with self._condition:
+                for job in self._jobs.values():
+                    if job['worker'] == worker.pid and job['status'] == 'running':
+                        job['status'] = 'failed'
+                        job['error'] = 'Worker process exited unexpectedly'
+                        job['updatedAt'] = time.time()
+                        self._pending -= 1
+                        self._save(job)
+                self._condition.notify_all()
+            self._spawn_worker()
+
+    def _expire_jobs(self):
+        cutoff = time.time() - self.result_ttl
+        with self._condition:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job['status'] in TERMINAL_STATES and job['updatedAt'] < cutoff]:
+                del self._jobs[job_id]
+        if self.store is not None:
+            try:
+                self.store.expire(cutoff)
+            except sqlite3.Error as e:
+                print(f"Job store expiry error: {e}")
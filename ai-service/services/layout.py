@@ -0,0 +1,94 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Boxes tilted less than this are drawn upright; OCR quads of straight text are rarely exactly level
+MIN_ROTATION_DEGREES = 3.0
+
+
+def bbox_array(text_areas: List[Dict]) -> np.ndarray:
+    """All bounding quads as one contiguous (N, 4, 2) float array, points clockwise from top-left"""
+    if not text_areas:
+        return np.zeros((0, 4, 2), dtype=np.float64)
+    return np.ascontiguousarray([np.asarray(area['bbox'], dtype=np.float64).reshape(-1, 2)[:4]
+                                 for area in text_areas])
+
+
+def box_geometry(boxes: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-box geometry of an (N, 4, 2) array, computed for all boxes at once
+
+    centers (N, 2), bounds (N, 4) as x0, y0, x1, y1, extents (N, 2) of the axis-aligned bounds,
+    sizes (N, 2) as edge lengths along the box's own axes, and angle (N,) in degrees of the top
+    edge, in [-90, 90).
+    """
+    top = boxes[:, 1] - boxes[:, 0]
+    side = boxes[:, 3] - boxes[:, 0]
+    lower, upper = boxes.min(axis=1), boxes.max(axis=1)
+    angle = np.degrees(np.arctan2(top[:, 1], top[:, 0]))
+    return {
+        'centers': boxes.mean(axis=1),
+        'bounds': np.concatenate([lower, upper], axis=1),
+        'extents': upper - lower,
+        'sizes': np.stack([np.hypot(top[:, 0], top[:, 1]), np.hypot(side[:, 0], side[:, 1])], axis=1),
+        'angle': (angle + 90) % 180 - 90
+    }
+
+
+def rotated_extents(sizes: np.ndarray, angle: np.ndarray) -> np.ndarray:
+    """Axis-aligned (width, height) of (N, 2) rectangles rotated by angle degrees"""
+    radians = np.radians(angle)
+    cos, sin = np.abs(np.cos(radians)), np.abs(np.sin(radians))
+    return np.stack([sizes[:, 0] * cos + sizes[:, 1] * sin, sizes[:, 0] * sin + sizes[:, 1] * cos], axis=1)
+
+
+def overlap_areas(centers: np.ndarray, extents: np.ndarray) -> np.ndarray:
+    """(N, N) intersection areas of axis-aligned rectangles; the diagonal is zero"""
+    penetration = _penetration(centers, extents / 2)[1].clip(min=0)
+    areas = penetration[..., 0] * penetration[..., 1]
+    np.fill_diagonal(areas, 0)
+    return areas
+
+
+def resolve_overlaps(centers: np.ndarray, extents: np.ndarray, page_size: Tuple[int, int],
+                     iterations: int = 8) -> np.ndarray:
+    """Nudge overlapping labels apart and keep them on the page; returns the new (N, 2) centers
+
+    Each overlapping pair is separated along the axis where it overlaps least, each label moving
+    half the distance. A few passes settle clusters where one move causes another overlap.
+    """
+    centers = centers.astype(np.float64, copy=True)
+    if len(centers) == 0:
+        return centers
+
+    half = extents / 2
+    width, height = page_size
+    low = half
+    high = np.maximum(np.array([width, height], dtype=np.float64) - half, half)
+    centers = np.minimum(np.maximum(centers, low), high)
+
+    for _ in range(iterations):
+        delta, penetration = _penetration(centers, half)
+        # Each unordered pair once; the dense test is cheap, the moves only touch overlapping pairs
+        first, second = np.nonzero(np.triu((penetration > 0).all(axis=2), k=1))
+        if not len(first):
+            break
+
+        pair_penetration = penetration[first, second]
+        axis = pair_penetration.argmin(axis=1)
+        amount = pair_penetration[np.arange(len(first)), axis] / 2
+        direction = np.sign(delta[first, second, axis])
+        # Pairs with identical centers split by index so they don't stay stacked
+        direction[direction == 0] = -1
+
+        moves = np.zeros_like(centers)
+        np.add.at(moves, (first, axis), direction * amount)
+        np.add.at(moves, (second, axis), -direction * amount)
+        centers = np.minimum(np.maximum(centers + moves, low), high)
+
+    return centers
+
+
+def _penetration(centers: np.ndarray, half: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairwise center offsets and per-axis overlap depths, both (N, N, 2); positive depth on both axes overlaps"""
+    delta = centers[:, None, :] - centers[None, :, :]
+    return delta, half[:, None, :] + half[None, :, :] - np.abs(delta)
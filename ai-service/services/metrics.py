@@ -0,0 +1,215 @@
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    bucket_labels = labels + (('le', repr(float(bound))),)
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        """Add a callable that renders extra metric lines at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+stage_duration = registry.histogram('manga_stage_duration_seconds', 'Time spent in each pipeline stage')
+request_duration = registry.histogram('manga_request_duration_seconds', 'End-to-end request latency by route')
+requests_total = registry.counter('manga_requests_total', 'Requests handled by route and status code')
+bytes_in = registry.counter('manga_bytes_in_total', 'Encoded image bytes received')
+bytes_out = registry.counter('manga_bytes_out_total', 'Encoded image bytes produced')
+bubbles_per_page = registry.histogram('manga_bubbles_per_page', 'Text areas detected per page',
+                                      buckets=(0, 1, 2, 5, 10, 20, 40, 80, 160))
+
+
+def cache_collector(name: str, stats: Callable[[], Dict]) -> Callable[[], List[str]]:
+    """Expose a cache's stats() counters as Prometheus metrics"""
+    def collect():
+        values = stats()
+        lines = []
+        for key, metric_type in (('hits', 'counter'), ('misses', 'counter'), ('entries', 'gauge')):
+            if key in values:
+                metric = f"manga_{name}_cache_{key}"
+                lines.append(f"# TYPE {metric} {metric_type}")
+                lines.append(f"{metric} {values[key]}")
+        return lines
+    return collect
+
+
+def begin_request_timings() -> Tuple[Dict[str, float], contextvars.Token]:
+    """Start collecting a per-request stage breakdown in the current context"""
+    timings = {}
+    return timings, _request_timings.set(timings)
+
+
+def end_request_timings(token: contextvars.Token):
+    _request_timings.reset(token)
+
+
+@contextmanager
+def start_request_timings():
+    """Collect a per-request stage breakdown for the duration of the block"""
+    timings, token = begin_request_timings()
+    try:
+        yield timings
+    finally:
+        end_request_timings(token)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a pipeline stage into the stage histogram and the current request breakdown"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0) + elapsed * 1000, 2)
+
+
+def timed(stage: str):
+    """Decorator form of stage_timer"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format understood by flamegraph tools"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+def save_profile(profiler: SamplingProfiler, route: str, elapsed: float, directory: Optional[str] = None) -> str:
+    directory = directory or os.environ.get('PROFILE_DIR', 'temp/profiles')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{int(time.time() * 1000)}_{route.strip('/').replace('/', '_')}_{int(elapsed * 1000)}ms.txt")
+    with open(path, 'w') as f:
+        f.write(profiler.collapsed())
+    return path
@@ -0,0 +1,136 @@
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class ModelRegistry:
+    def __init__(self, idle_timeout: Optional[float] = None):
+        if idle_timeout is None:
+            idle_timeout = float(os.environ.get('MODEL_IDLE_TIMEOUT', '0'))
+        self.idle_timeout = idle_timeout
+        self._loaders = {}
+        self._models = {}
+        self._last_used = {}
+        self._locks = {}
+        self._inference_locks = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        """Register a loader; the model is only built the first time it is requested"""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks[name] = threading.Lock()
+            self._inference_locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        """Return the resident model, loading it once on first use"""
+        model_lock = self._locks[name]
+        with model_lock:
+            model = self._models.get(name)
+            if model is None:
+                started = time.time()
+                model = self._loaders[name]()
+                print(f"Loaded model '{name}' in {time.time() - started:.1f}s")
+                self._models[name] = model
+                self._start_reaper()
+            self._last_used[name] = time.time()
+            return model
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[Any]:
+        """Hold the model for one inference call; calls on the same model run one at a time
+
+        Pipelines such as diffusers keep scheduler state on the instance, so two request threads
+        sharing it would corrupt each other's run. The model also can't be unloaded while held.
+        """
+        with self._inference_locks[name]:
+            yield self.get(name)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def unload(self, name: str):
+        """Drop a resident model so its memory can be reclaimed"""
+        with self._inference_locks[name], self._locks[name]:
+            if self._models.pop(name, None) is not None:
+                self._last_used.pop(name, None)
+                gc.collect()
+                try:
+                    import torch
+                    if torch.cuda.is_available():
+                        torch.cuda.empty_cache()
+                except ImportError:
+                    pass
+                print(f"Unloaded idle model '{name}'")
+
+    def reset_after_fork(self):
+        """Fresh locks and reaper in a forked worker; threads and held locks don't survive fork()"""
+        self._lock = threading.Lock()
+        self._locks = {name: threading.Lock() for name in self._loaders}
+        self._inference_locks = {name: threading.Lock() for name in self._loaders}
+        self._reaper = None
+        if self._models:
+            self._start_reaper()
+
+    def warm_up(self, names: Optional[List[str]] = None):
+        """Load models ahead of the first request, in a background thread"""
+        names = names if names is not None else list(self._loaders)
+        thread = threading.Thread(target=self._warm_up, args=(names,), daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> Dict[str, Any]:
+        return {name: {'loaded': name in self._models, 'lastUsed': self._last_used.get(name)}
+                for name in self._loaders}
+
+    def _warm_up(self, names: List[str]):
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Warm-up of model '{name}' failed: {e}")
+
+    def _start_reaper(self):
+        if self.idle_timeout <= 0 or self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target=self._reap_idle, daemon=True)
+        self._reaper.start()
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 60))
+            now = time.time()
+            for name, last_used in list(self._last_used.items()):
+                if now - last_used > self.idle_timeout:
+                    self.unload(name)
+
+
+def load_colorization_pipeline():
+    """Build the Stable Diffusion img2img pipeline with optional CPU-friendly settings"""
+    from diffusers import StableDiffusionImg2ImgPipeline
+    import torch
+
+    num_threads = int(os.environ.get('TORCH_NUM_THREADS', '0'))
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+    pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
+        os.environ.get('COLORIZATION_MODEL', 'runwayml/stable-diffusion-v1-5'),
+        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+    )
+
+    if torch.cuda.is_available():
+        pipe = pipe.to("cuda")
+
+    if os.environ.get('SD_ATTENTION_SLICING', '1') == '1':
+        pipe.enable_attention_slicing()
+
+    if os.environ.get('SD_CHANNELS_LAST', '0') == '1':
+        pipe.unet.to(memory_format=torch.channels_last)
+        pipe.vae.to(memory_format=torch.channels_last)
+
+    return pipe
@@ -0,0 +1,193 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from services.phash import crop_box
+
+DEFAULT_OPTIONS = {
+    'detectScale': float(os.environ.get('OCR_DETECT_SCALE', '1.0')),
+    'minSize': int(os.environ.get('OCR_MIN_SIZE', '10')),
+    'confidence': float(os.environ.get('OCR_CONFIDENCE', '0.5')),
+    'tileHeight': int(os.environ.get('OCR_TILE_HEIGHT', '2048')),
+    'tileOverlap': int(os.environ.get('OCR_TILE_OVERLAP', '256'))
+}
+
+# Pages at least this many times taller than wide are treated as webtoon strips
+STRIP_ASPECT_RATIO = float(os.environ.get('OCR_STRIP_ASPECT', '3.0'))
+TILE_WORKERS = int(os.environ.get('OCR_TILE_WORKERS', '2'))
+
+
+def resolve_ocr_options(options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Merge per-request OCR options over the configured defaults and validate them"""
+    resolved = dict(DEFAULT_OPTIONS)
+    for key, value in (options or {}).items():
+        if key not in DEFAULT_OPTIONS:
+            raise Exception(f"Unknown OCR option: {key}")
+        resolved[key] = type(DEFAULT_OPTIONS[key])(value)
+
+    if not 0 < resolved['detectScale'] <= 1:
+        raise Exception("detectScale must be in (0, 1]")
+    if not 0 <= resolved['confidence'] <= 1:
+        raise Exception("confidence must be in [0, 1]")
+    if not 0 <= resolved['tileOverlap'] < resolved['tileHeight']:
+        raise Exception("tileOverlap must be smaller than tileHeight")
+    return resolved
+
+
+def _rescale_boxes(horizontal: List, free: List, scale: float) -> Tuple[List, List]:
+    horizontal = [[int(round(v / scale)) for v in box] for box in horizontal]
+    free = [[[int(round(x / scale)), int(round(y / scale))] for x, y in box] for box in free]
+    return horizontal, free
+
+
+def _recognize_with_memo(reader: Any, grey: np.ndarray, horizontal: List, free: List,
+                         memo: Any, language: str) -> List[Tuple[Any, str, float]]:
+    """Recognize only the crops the memo has not seen; near-identical crops reuse earlier text"""
+    results = []
+    missed_horizontal = []
+    missed_free = []
+    for box in horizontal:
+        x0, x1, y0, y1 = box
+        found = memo.lookup(crop_box(grey, [[x0, y0], [x1, y1]]), language)
+        if found is None:
+            missed_horizontal.append(box)
+        else:
+            results.append(([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], found[0], found[1]))
+    for box in free:
+        found = memo.lookup(crop_box(grey, box), language)
+        if found is None:
+            missed_free.append(box)
+        else:
+            results.append((box, found[0], found[1]))
+
+    if missed_horizontal or missed_free:
+        recognized = reader.recognize(grey, horizontal_list=missed_horizontal, free_list=missed_free)
+        for bbox, text, confidence in recognized:
+            memo.add(crop_box(grey, bbox), language, text, float(confidence))
+        results.extend(recognized)
+    return results
+
+
+def read_text(reader: Any, image: np.ndarray, options: Dict[str, Any],
+              memo: Any = None, language: str = '') -> List[Tuple[Any, str, float]]:
+    """Run EasyOCR, optionally detecting on a downscaled copy and recognizing on full-resolution crops"""
+    scale = options['detectScale']
+    min_size = options['minSize']
+
+    if scale >= 1 and memo is None:
+        results = reader.readtext(image, min_size=min_size)
+    else:
+        # readtext is detect + recognize; splitting them lets detection run small and recognition be memoized
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+        horizontal, free = reader.detect(small, min_size=max(1, int(min_size * scale)))
+        horizontal, free = horizontal[0], free[0]
+        if scale < 1:
+            horizontal, free = _rescale_boxes(horizontal, free, scale)
+
+        # Re-apply readtext's min_size rule at full resolution; the scaled threshold lets rounding through
+        horizontal = [box for box in horizontal if max(box[1] - box[0], box[3] - box[2]) > min_size]
+        free = [box for box in free if _larger_than(box, min_size)]
+        if not horizontal and not free:
+            return []
+
+        grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        if memo is None:
+            results = reader.recognize(grey, horizontal_list=horizontal, free_list=free)
+        else:
+            results = _recognize_with_memo(reader, grey, horizontal, free, memo, language)
+
+    return [(bbox, text, confidence) for bbox, text, confidence in results
+            if confidence > options['confidence']]
+
+
+def is_strip(image: np.ndarray, options: Dict[str, Any]) -> bool:
+    height, width = image.shape[:2]
+    return height > options['tileHeight'] and height >= STRIP_ASPECT_RATIO * width
+
+
+def tile_ranges(height: int, tile_height: int, overlap: int) -> List[Tuple[int, int]]:
+    """Overlapping row ranges covering the full height"""
+    step = tile_height - overlap
+    ranges = []
+    start = 0
+    while True:
+        end = min(start + tile_height, height)
+        ranges.append((start, end))
+        if end >= height:
+            return ranges
+        start += step
+
+
+def _larger_than(bbox: Any, min_size: float) -> bool:
+    """EasyOCR's size rule: the longer side of the box's bounds exceeds min_size"""
+    x0, y0, x1, y1 = _box_rect(bbox)
+    return max(x1 - x0, y1 - y0) > min_size
+
+
+def _box_rect(bbox: Any) -> Tuple[float, float, float, float]:
+    points = np.asarray(bbox, dtype=np.float64).reshape(-1, 2)
+    return points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max()
+
+
+def _overlap_ratio(a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
+    """Intersection over the smaller box, so a line cut in half by a tile edge still matches the full line"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return width * height / smaller if smaller > 0 else 0.0
+
+
+def dedupe_overlaps(tiles: List[Tuple[Tuple[int, int], List]]) -> List:
+    """Merge results from adjacent tiles, keeping the most complete copy of boxes seen twice"""
+    kept = []
+    previous = []
+    for _, results in tiles:
+        current = []
+        for bbox, text, confidence in results:
+            rect = _box_rect(bbox)
+            area = (rect[2] - rect[0]) * (rect[3] - rect[1])
+            duplicate = None
+            for j, (other_rect, other_area, _) in enumerate(previous):
+                if _overlap_ratio(rect, other_rect) > 0.5:
+                    duplicate = j
+                    break
+
+            if duplicate is None:
+                current.append((rect, area, (bbox, text, confidence)))
+                continue
+
+            _, other_area, other = previous[duplicate]
+            if (area, confidence) > (other_area, other[2]):
+                # The copy from this tile wins; it may still overlap the next tile
+                previous.pop(duplicate)
+                current.append((rect, area, (bbox, text, confidence)))
+
+        # Only neighbouring tiles overlap, so earlier tiles can be finalized
+        kept.extend(item for _, _, item in previous)
+        previous = current
+    kept.extend(item for _, _, item in previous)
+    return kept
+
+
+def read_text_tiled(reader: Any, image: np.ndarray, options: Dict[str, Any],
+                    memo: Any = None, language: str = '') -> List[Tuple[Any, str, float]]:
+    """OCR a tall strip as overlapping row tiles; tiles are views into the page, not copies"""
+    ranges = tile_ranges(image.shape[0], options['tileHeight'], options['tileOverlap'])
+
+    def run(row_range):
+        top, bottom = row_range
+        results = read_text(reader, image[top:bottom], options, memo, language)
+        shifted = []
+        for bbox, text, confidence in results:
+            shifted.append(([[int(x), int(y) + top] for x, y in bbox], text, confidence))
+        return row_range, shifted
+
+    with ThreadPoolExecutor(max_workers=max(1, TILE_WORKERS)) as executor:
+        tiles = list(executor.map(run, ranges))
+
+    return dedupe_overlaps(tiles)
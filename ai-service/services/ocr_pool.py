@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# EasyOCR pairs every CJK recognition model with English
+OCR_LANGUAGES = {
+    'ja': ['ja', 'en'],
+    'ko': ['ko', 'en'],
+    'zh': ['ch_sim', 'en'],
+    'zh-tw': ['ch_tra', 'en'],
+    'en': ['en']
+}
+
+
+class OCRReaderPool:
+    def __init__(self, max_readers: Optional[int] = None, default_language: Optional[str] = None):
+        self.max_readers = max_readers or int(os.environ.get('OCR_MAX_READERS', '2'))
+        self.default_language = default_language or os.environ.get('OCR_DEFAULT_LANGUAGE', 'ja')
+        self._readers = OrderedDict()
+        self._build_locks = {}
+        self._lock = threading.Lock()
+
+    def resolve_language(self, source_lang: Optional[str] = None) -> str:
+        """Map a requested source language to a supported reader key"""
+        if not source_lang or source_lang == 'auto':
+            return self.default_language
+        source_lang = source_lang.lower()
+        if source_lang in OCR_LANGUAGES:
+            return source_lang
+        base = source_lang.split('-')[0]
+        if base in OCR_LANGUAGES:
+            return base
+        raise Exception(f"Unsupported source language: {source_lang}")
+
+    def get(self, source_lang: Optional[str] = None) -> Any:
+        """Return the reader for a language, building it on first use"""
+        language = self.resolve_language(source_lang)
+
+        with self._lock:
+            reader = self._readers.get(language)
+            if reader is not None:
+                self._readers.move_to_end(language)
+                return reader
+            build_lock = self._build_locks.setdefault(language, threading.Lock())
+
+        # Build outside the pool lock so other languages stay available meanwhile
+        with build_lock:
+            with self._lock:
+                reader = self._readers.get(language)
+            if reader is None:
+                import easyocr
+                reader = easyocr.Reader(OCR_LANGUAGES[language])
+
+            with self._lock:
+                self._readers[language] = reader
+                self._readers.move_to_end(language)
+                while len(self._readers) > self.max_readers:
+                    evicted, _ = self._readers.popitem(last=False)
+                    print(f"Evicted OCR reader '{evicted}'")
+            return reader
+
+    def evict(self, source_lang: Optional[str] = None):
+        language = self.resolve_language(source_lang)
+        with self._lock:
+            self._readers.pop(language, None)
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._readers)
+
+    def status(self) -> Dict[str, Any]:
+        return {'loaded': self.loaded(), 'maxReaders': self.max_readers, 'defaultLanguage': self.default_language}
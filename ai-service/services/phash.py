@@ -0,0 +1,234 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def _grey(image: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), 'big')
+
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """Difference hash: hash_size * hash_size bits comparing horizontally adjacent pixels"""
+    small = cv2.resize(_grey(image), (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(image: np.ndarray) -> int:
+    """64-bit DCT perceptual hash, robust to rescaling and JPEG re-encoding"""
+    small = cv2.resize(_grey(image), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # Skip the DC term when taking the median so flat brightness shifts don't flip bits
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class HashIndex:
+    """Hamming-radius lookup by multi-index hashing
+
+    The hash is split into max_distance + 1 chunks, so any stored hash within max_distance bits
+    matches the query exactly on at least one chunk; only those bucket members are compared.
+    At most max_entries are kept, in memory and on disk; the oldest are dropped first.
+    """
+
+    def __init__(self, bits: int = 64, max_distance: int = 4, db_path: Optional[str] = None, table: str = 'hashes',
+                 max_entries: Optional[int] = None):
+        if not 0 <= max_distance < bits:
+            raise ValueError(f"max_distance must be in [0, {bits})")
+        self.bits = bits
+        self.max_distance = max_distance
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.environ.get('PHASH_INDEX_MAX_ENTRIES', '100000'))
+        chunks = max_distance + 1
+        # Spread the remainder so chunk widths differ by at most one bit
+        widths = [bits // chunks + (1 if i < bits % chunks else 0) for i in range(chunks)]
+        self._chunks = [(sum(widths[:i]), (1 << width) - 1) for i, width in enumerate(widths)]
+        self.table = table
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._tables = [defaultdict(list) for _ in range(chunks)]
+        self._lock = threading.Lock()
+        self._db = None
+
+        if db_path:
+            try:
+                directory = os.path.dirname(db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    f'CREATE TABLE IF NOT EXISTS {table} ('
+                    'namespace TEXT NOT NULL, hash TEXT NOT NULL, value TEXT NOT NULL)'
+                )
+                # Trim to the newest rows before loading, so startup cost and memory stay bounded
+                self._db.execute(
+                    f'DELETE FROM {table} WHERE rowid NOT IN '
+                    f'(SELECT rowid FROM {table} ORDER BY rowid DESC LIMIT ?)', (self.max_entries,)
+                )
+                self._db.commit()
+                for namespace, hash_hex, value in self._db.execute(
+                        f'SELECT namespace, hash, value FROM {table} ORDER BY rowid'):
+                    self._insert(namespace, int(hash_hex, 16), value)
+            except sqlite3.Error as e:
+                print(f"Hash index disabled on-disk store: {e}")
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def reopen(self):
+        """Reconnect after fork(); a SQLite connection must not be used by two processes"""
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def add(self, namespace: str, hash_value: int, value: str):
+        with self._lock:
+            self._insert(namespace, hash_value, value)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._delete(next(iter(self._entries)))
+                evicted += 1
+            if self._db is not None:
+                try:
+                    self._db.execute(f'INSERT INTO {self.table} (namespace, hash, value) VALUES (?, ?, ?)',
+                                     (namespace, format(hash_value, 'x'), value))
+                    if evicted:
+                        self._db.execute(
+                            f'DELETE FROM {self.table} WHERE rowid IN '
+                            f'(SELECT rowid FROM {self.table} ORDER BY rowid LIMIT ?)', (evicted,)
+                        )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Hash index write error: {e}")
+
+    def lookup(self, namespace: str, hash_value: int) -> Optional[Tuple[str, int]]:
+        """Closest stored (value, distance) within max_distance bits, or None"""
+        found = self.candidates(namespace, hash_value)
+        return found[0] if found else None
+
+    def candidates(self, namespace: str, hash_value: int) -> List[Tuple[str, int]]:
+        """Every stored (value, distance) within max_distance bits, closest first"""
+        found = []
+        with self._lock:
+            for entry_id in self._matches(namespace, hash_value):
+                _, stored_hash, value = self._entries[entry_id]
+                found.append((value, hamming(hash_value, stored_hash)))
+        return sorted(found, key=lambda item: item[1])
+
+    def discard(self, namespace: str, hash_value: int, value: str):
+        """Forget entries with this value that a lookup of hash_value would return"""
+        with self._lock:
+            stale = [entry_id for entry_id in self._matches(namespace, hash_value)
+                     if self._entries[entry_id][2] == value]
+            for entry_id in stale:
+                self._delete(entry_id)
+            if stale and self._db is not None:
+                try:
+                    self._db.execute(f'DELETE FROM {self.table} WHERE namespace = ? AND value = ?', (namespace, value))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Hash index write error: {e}")
+
+    def _matches(self, namespace: str, hash_value: int) -> List[int]:
+        seen = set()
+        matches = []
+        for position, chunk in enumerate(self._split(hash_value)):
+            for entry_id in self._tables[position].get((namespace, chunk), ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                if hamming(hash_value, self._entries[entry_id][1]) <= self.max_distance:
+                    matches.append(entry_id)
+        return matches
+
+    def _insert(self, namespace: str, hash_value: int, value: str):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (namespace, hash_value, value)
+        for position, chunk in enumerate(self._split(hash_value)):
+            self._tables[position][(namespace, chunk)].append(entry_id)
+
+    def _delete(self, entry_id: int):
+        namespace, hash_value, _ = self._entries.pop(entry_id)
+        for position, chunk in enumerate(self._split(hash_value)):
+            bucket = self._tables[position][(namespace, chunk)]
+            bucket.remove(entry_id)
+            if not bucket:
+                del self._tables[position][(namespace, chunk)]
+
+    def _split(self, hash_value: int):
+        for shift, mask in self._chunks:
+            yield (hash_value >> shift) & mask
+
+
+class OCRMemo:
+    """Remembers recognized text per bubble crop so repeated crops skip recognition
+
+    The dHash only finds candidates: crops with different words can be a few bits apart, so a hit
+    also needs the exact same binarised crop.
+    """
+
+    def __init__(self, index: HashIndex, hash_size: int = 16):
+        self.index = index
+        self.hash_size = hash_size
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, crop: np.ndarray, language: str) -> Tuple[str, int]:
+        height, width = crop.shape[:2]
+        # Bucket by shape so crops of different proportions never collide
+        namespace = f"{language}:{round(width / max(height, 1), 1)}"
+        return namespace, dhash(crop, self.hash_size)
+
+    def lookup(self, crop: np.ndarray, language: str) -> Optional[Tuple[str, float]]:
+        if crop.size == 0:
+            return None
+        namespace, hash_value = self._key(crop, language)
+        digest = ink_digest(crop)
+        for value, _ in self.index.candidates(namespace, hash_value):
+            parts = value.rsplit('\t', 2)
+            # Entries written before crops were verified carry no digest and never match
+            if len(parts) == 3 and parts[2] == digest:
+                self.hits += 1
+                return parts[0], float(parts[1])
+        self.misses += 1
+        return None
+
+    def add(self, crop: np.ndarray, language: str, text: str, confidence: float):
+        if crop.size == 0:
+            return
+        namespace, hash_value = self._key(crop, language)
+        self.index.add(namespace, hash_value, f"{text}\t{confidence}\t{ink_digest(crop)}")
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.index)}
+
+
+def ink_digest(crop: np.ndarray) -> str:
+    """Exact hash of a crop's Otsu-binarised ink at full resolution; equal only for the same glyphs"""
+    _, ink = cv2.threshold(_grey(crop), 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    digest = hashlib.sha1(np.packbits(ink).tobytes())
+    digest.update(str(ink.shape).encode())
+    return digest.hexdigest()
+
+
+def crop_box(image: np.ndarray, bbox: Any) -> np.ndarray:
+    points = np.asarray(bbox, dtype=np.float64).reshape(-1, 2)
+    height, width = image.shape[:2]
+    x0, y0 = max(int(points[:, 0].min()), 0), max(int(points[:, 1].min()), 0)
+    x1, y1 = min(int(np.ceil(points[:, 0].max())), width), min(int(np.ceil(points[:, 1].max())), height)
+    return image[y0:y1, x0:x1]
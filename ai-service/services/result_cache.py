@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+_HANDLE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+class ResultCache:
+    """Maps a result key to its output in the artifact store
+
+    Only a small metadata file per entry lives here; the output bytes are stored once, in the
+    artifact store, under its size cap. An entry whose artifact was evicted counts as a miss.
+    """
+
+    def __init__(self, artifacts: Any, directory: Optional[str] = None, max_entries: Optional[int] = None):
+        self.artifacts = artifacts
+        self.directory = directory if directory is not None else os.environ.get(
+            'RESULT_CACHE_DIR', 'temp/result_cache')
+        self.max_entries = max_entries if max_entries is not None else int(
+            os.environ.get('RESULT_CACHE_MAX_ENTRIES', '100000'))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_index()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, options: Dict[str, Any]) -> str:
+        """Content address for an input image plus the options that affect the output"""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(json.dumps(options, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """Return (image bytes, metadata) for a cached result; metadata carries its artifactId"""
+        if not self.directory:
+            return None
+
+        # Read the entry from disk even when this process hasn't indexed it; other workers and
+        # the job processes write to the same directory
+        meta = self._read_meta(key)
+        artifact = self.artifacts.get(meta.get('artifactId', '')) if meta else None
+        data = self.artifacts.read(artifact) if artifact is not None else None
+
+        with self._lock:
+            if data is None:
+                if meta is not None or key in self._index:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._index[key] = True
+            self._index.move_to_end(key)
+            self.hits += 1
+
+        try:
+            os.utime(self._meta_path(key))
+        except OSError:
+            pass
+        return data, meta
+
+    def put(self, key: str, data: bytes, meta: Dict[str, Any]) -> Optional[str]:
+        """Store a processed result; returns the id of the artifact holding its bytes"""
+        if not self.directory:
+            return None
+
+        artifact = self.artifacts.put(data, meta['mimeType'])
+        meta = dict(meta, artifactId=artifact['id'])
+        meta_path = self._meta_path(key)
+        try:
+            # Write to a temp file first so readers never see a partial entry
+            with open(meta_path + '.tmp', 'w') as f:
+                json.dump(meta, f)
+            os.replace(meta_path + '.tmp', meta_path)
+        except OSError as e:
+            print(f"Result cache write error: {e}")
+            return artifact['id']
+
+        with self._lock:
+            self._index[key] = True
+            self._index.move_to_end(key)
+            while len(self._index) > self.max_entries:
+                self._remove(next(iter(self._index)))
+                self.evictions += 1
+        return artifact['id']
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics for the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._index),
+                'maxEntries': self.max_entries
+            }
+
+    def _read_meta(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._meta_path(key), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.bin'):
+                # Outputs cached before they moved to the artifact store
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+            try:
+                entries.append((os.stat(path).st_mtime, name[:-len('.json')]))
+            except OSError:
+                continue
+
+        for _, key in sorted(entries):
+            self._index[key] = True
+
+    def _remove(self, key: str):
+        self._index.pop(key, None)
+        try:
+            os.remove(self._meta_path(key))
+        except OSError:
+            pass
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+
+class ResultHandleStore:
+    """Short-lived opaque handles to outputs kept in the artifact store
+
+    A handle is a small file naming its artifact, so any worker process can serve a handle
+    another one issued; it expires ttl seconds after it was issued.
+    """
+
+    def __init__(self, artifacts: Any, directory: Optional[str] = None, ttl: Optional[float] = None):
+        self.artifacts = artifacts
+        self.directory = directory if directory is not None else os.environ.get(
+            'RESULT_HANDLE_DIR', 'temp/result_handles')
+        self.ttl = ttl if ttl is not None else float(os.environ.get('RESULT_HANDLE_TTL', '120'))
+        self._last_expire = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def put(self, data: bytes, mime_type: str) -> str:
+        """Store encoded output and return an opaque handle for fetching it"""
+        artifact = self.artifacts.put(data, mime_type)
+        handle = secrets.token_urlsafe(16)
+        path = os.path.join(self.directory, handle)
+        with open(path + '.tmp', 'w') as f:
+            f.write(artifact['id'])
+        os.replace(path + '.tmp', path)
+
+        if time.time() - self._last_expire > self.ttl:
+            self._expire()
+        return handle
+
+    def get(self, handle: str) -> Optional[Tuple[bytes, str]]:
+        if not _HANDLE.match(handle or ''):
+            return None
+        path = os.path.join(self.directory, handle)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                artifact = self.artifacts.get(f.read().strip())
+        except OSError:
+            return None
+
+        data = self.artifacts.read(artifact) if artifact is not None else None
+        return (data, artifact['mimeType']) if data is not None else None
+
+    def _expire(self):
+        self._last_expire = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if self._last_expire - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                continue
@@ -0,0 +1,174 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FALLBACK_FONTS = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    'DejaVuSans.ttf'
+]
+
+
+class FontManager:
+    def __init__(self, max_fonts: int = 64, max_words: int = 100000):
+        self.max_fonts = max_fonts
+        self.max_words = max_words
+        self._fonts = OrderedDict()
+        self._word_widths = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_font(self, path: Optional[str], size: int) -> Any:
+        """Return a loaded font for (path, size), opening each TrueType file once"""
+        key = (path, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                return font
+
+        font = self._load(path, size)
+        # Word widths are keyed on this rather than id(), which can be reused after eviction
+        font.cache_key = key
+        with self._lock:
+            self._fonts[key] = font
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+        return font
+
+    def text_width(self, font: Any, text: str) -> float:
+        """Width of a word in pixels, memoized per font"""
+        key = (getattr(font, 'cache_key', id(font)), text)
+        with self._lock:
+            width = self._word_widths.get(key)
+            if width is not None:
+                return width
+
+        width = font.getlength(text) if hasattr(font, 'getlength') else len(text) * 10
+        with self._lock:
+            self._word_widths[key] = width
+            while len(self._word_widths) > self.max_words:
+                self._word_widths.popitem(last=False)
+        return width
+
+    def wrap_text(self, text: str, font: Any, max_width: float) -> List[Tuple[str, float]]:
+        """Greedy word wrap measuring each word once; returns (line, width) pairs"""
+        space = self.text_width(font, ' ')
+        lines = []
+        current_words = []
+        current_width = 0.0
+
+        for word in text.split():
+            word_width = self.text_width(font, word)
+            candidate = current_width + space + word_width if current_words else word_width
+            if candidate <= max_width or not current_words:
+                current_words.append(word)
+                current_width = candidate
+            else:
+                lines.append((' '.join(current_words), current_width))
+                current_words = [word]
+                current_width = word_width
+
+        if current_words:
+            lines.append((' '.join(current_words), current_width))
+
+        return lines if lines else [(text, self.text_width(font, text))]
+
+    def fit_text(self, text: str, path: Optional[str], max_width: float, max_height: float,
+                 min_size: int = 10, max_size: int = 40,
+                 line_spacing: float = 1.25) -> Tuple[Any, List[Tuple[str, float]], int]:
+        """Largest font size whose wrapped text fits the box; returns (font, lines, line height)"""
+        best = None
+        low, high = min_size, max(min_size, max_size)
+
+        while low <= high:
+            size = (low + high) // 2
+            font = self.get_font(path, size)
+            lines = self.wrap_text(text, font, max_width)
+            line_height = int(round(size * line_spacing))
+            if len(lines) * line_height <= max_height and all(width <= max_width for _, width in lines):
+                best = (font, lines, line_height)
+                low = size + 1
+            else:
+                high = size - 1
+
+        if best is None:
+            # Nothing fits; use the smallest size and let the text overflow
+            font = self.get_font(path, min_size)
+            best = (font, self.wrap_text(text, font, max_width), int(round(min_size * line_spacing)))
+        return best
+
+    def _load(self, path: Optional[str], size: int) -> Any:
+        for candidate in ([path] if path else []) + FALLBACK_FONTS:
+            try:
+                return ImageFont.truetype(candidate, size)
+            except OSError:
+                continue
+        return ImageFont.load_default()
+
+
+_shared_fonts = None
+_shared_lock = threading.Lock()
+
+
+def get_font_manager() -> FontManager:
+    """Process-wide font manager shared by the renderers"""
+    global _shared_fonts
+    with _shared_lock:
+        if _shared_fonts is None:
+            _shared_fonts = FontManager(
+                max_fonts=int(os.environ.get('FONT_CACHE_SIZE', '64'))
+            )
+        return _shared_fonts
+
+
+def render_label_block(lines: List[Tuple[str, float]], font: Any, line_height: int, center_x: float,
+                       start_y: float, box_height: int) -> Tuple[np.ndarray, int, int]:
+    """Render centered, boxed lines into a small RGBA tile; returns (tile, left, top) in page coordinates"""
+    max_width = max(width for _, width in lines)
+    left = int(np.floor(center_x - max_width / 2 - 2))
+    top = int(np.floor(start_y - 2))
+    width = int(np.ceil(max_width)) + 6
+    height = (len(lines) - 1) * line_height + box_height + 4
+
+    tile = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    for i, (line, line_width) in enumerate(lines):
+        x = center_x - line_width / 2 - left
+        y = start_y + i * line_height - top
+        draw.rectangle([x-2, y-2, x+line_width+2, y+box_height], fill='white', outline='black')
+        draw.text((x, y), line, fill='black', font=font)
+
+    return np.asarray(tile), left, top
+
+
+def rotate_label(tile: np.ndarray, left: int, top: int, angle: float) -> Tuple[np.ndarray, int, int]:
+    """Rotate an RGBA label tile by angle degrees (clockwise in image coordinates) about its center"""
+    rotated = np.asarray(Image.fromarray(tile).rotate(-angle, resample=Image.BICUBIC, expand=True))
+    center_x, center_y = left + tile.shape[1] / 2, top + tile.shape[0] / 2
+    return rotated, int(round(center_x - rotated.shape[1] / 2)), int(round(center_y - rotated.shape[0] / 2))
+
+
+def composite_rgba(image: np.ndarray, tile: np.ndarray, left: int, top: int):
+    """Alpha-blend an RGBA tile onto a BGR image in place, touching only the covered region"""
+    height, width = image.shape[:2]
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + tile.shape[1], width), min(top + tile.shape[0], height)
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    patch = tile[y0 - top:y1 - top, x0 - left:x1 - left]
+    alpha = patch[:, :, 3:4]
+    region = image[y0:y1, x0:x1]
+    bgr = patch[:, :, 2::-1]
+
+    opaque = alpha[:, :, 0] == 255
+    if opaque.all():
+        region[:] = bgr
+        return
+
+    blended = (region.astype(np.uint16) * (255 - alpha) + bgr.astype(np.uint16) * alpha + 127) // 255
+    region[:] = blended.astype(image.dtype)
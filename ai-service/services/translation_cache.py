@@ -0,0 +1,164 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TranslationCache:
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 10000,
+                 ttl_seconds: int = 30 * 24 * 3600, max_disk_entries: int = 500000, prune_every: int = 1000):
+        self.db_path = db_path if db_path is not None else os.environ.get(
+            'TRANSLATION_CACHE_PATH', 'temp/translation_cache.sqlite3')
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        # The on-disk bounds are re-applied after this many writes, so a long-running process stays within them
+        self.prune_every = prune_every
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if self.db_path:
+            try:
+                directory = os.path.dirname(self.db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS translations ('
+                    'text TEXT NOT NULL, target_lang TEXT NOT NULL, '
+                    'translated TEXT NOT NULL, created_at REAL NOT NULL, '
+                    'PRIMARY KEY (text, target_lang))'
+                )
+                # Pruning deletes by age; without this each pass sorts the whole table
+                self._db.execute('CREATE INDEX IF NOT EXISTS translations_created_at ON translations (created_at)')
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Translation cache disabled on-disk store: {e}")
+                self._db = None
+
+            self.prune()
+
+    def get(self, text: str, target_lang: str) -> Optional[str]:
+        """Return a cached translation, checking memory first and then the on-disk store"""
+        key = (text, target_lang)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                translated, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return translated
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        'SELECT translated, created_at FROM translations WHERE text = ? AND target_lang = ?',
+                        key
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    print(f"Translation cache read error: {e}")
+                    row = None
+
+                if row is not None and now - row[1] <= self.ttl_seconds:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, text: str, target_lang: str, translated: str):
+        """Store a translation in memory and in the on-disk store"""
+        key = (text, target_lang)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, translated, now)
+
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO translations (text, target_lang, translated, created_at) '
+                        'VALUES (?, ?, ?, ?)',
+                        (text, target_lang, translated, now)
+                    )
+                    self._db.commit()
+                    self._writes += 1
+                except sqlite3.Error as e:
+                    print(f"Translation cache write error: {e}")
+            due = self._writes >= self.prune_every
+
+        if due:
+            self.prune()
+
+    def prune(self) -> int:
+        """Drop expired rows and trim the on-disk store to max_disk_entries"""
+        if self._db is None:
+            return 0
+
+        with self._lock:
+            self._writes = 0
+            try:
+                cutoff = time.time() - self.ttl_seconds
+                removed = self._db.execute('DELETE FROM translations WHERE created_at < ?', (cutoff,)).rowcount
+                removed += self._db.execute(
+                    'DELETE FROM translations WHERE rowid IN ('
+                    'SELECT rowid FROM translations ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_disk_entries,)
+                ).rowcount
+                self._db.commit()
+                return removed
+            except sqlite3.Error as e:
+                print(f"Translation cache prune error: {e}")
+                return 0
+
+    def reopen(self):
+        """Reconnect after fork(); a SQLite connection must not be used by two processes"""
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'diskHits': self.disk_hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._memory),
+                'maxEntries': self.max_entries
+            }
+
+    def _remember(self, key: Tuple[str, str], translated: str, created_at: float):
+        self._memory[key] = (translated, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> TranslationCache:
+    """Process-wide cache shared by MangaProcessor and AITranslator"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = TranslationCache()
+        return _shared_cache
@@ -0,0 +1,338 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from services.http_client import ProviderClient
+from services.model_registry import ModelRegistry
+from services.translation_cache import TranslationCache
+
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+# Lines per GPT-4 batch request; larger pages are split into concurrent requests
+AI_TRANSLATE_BATCH_SIZE = int(os.environ.get('AI_TRANSLATE_BATCH_SIZE', '20'))
+
+# Texts per backend call when the caller wants progress updates
+TRANSLATE_PROGRESS_CHUNK = int(os.environ.get('TRANSLATE_PROGRESS_CHUNK', '4'))
+
+LOCAL_TRANSLATION_MODEL = os.environ.get('LOCAL_TRANSLATION_MODEL', 'facebook/nllb-200-distilled-600M')
+LOCAL_TRANSLATION_BATCH_SIZE = int(os.environ.get('LOCAL_TRANSLATION_BATCH_SIZE', '16'))
+LOCAL_TRANSLATION_BEAMS = int(os.environ.get('LOCAL_TRANSLATION_BEAMS', '1'))
+
+# FLORES-200 codes used by NLLB for the languages the service handles
+NLLB_LANGUAGES = {
+    'en': 'eng_Latn', 'ja': 'jpn_Jpan', 'ko': 'kor_Hang', 'zh': 'zho_Hans', 'zh-tw': 'zho_Hant',
+    'es': 'spa_Latn', 'fr': 'fra_Latn', 'de': 'deu_Latn', 'it': 'ita_Latn', 'pt': 'por_Latn',
+    'ru': 'rus_Cyrl', 'vi': 'vie_Latn', 'th': 'tha_Thai', 'id': 'ind_Latn', 'ar': 'arb_Arab'
+}
+
+
+class TranslatorBackend(ABC):
+    """A translation engine; returns one translation per input, or None where it failed"""
+
+    name = ''
+    # Prefix for translation cache keys, so engines don't serve each other's output
+    cache_namespace = ''
+
+    @abstractmethod
+    def translate_batch(self, texts: List[str], target_lang: str, source_lang: str = 'auto',
+                        context: str = 'manga') -> List[Optional[str]]:
+        ...
+
+    def cache_namespace_for(self, target_lang: str, source_lang: str = 'auto') -> str:
+        """Cache key prefix for a language pair; overridden where output depends on more than the target"""
+        return self.cache_namespace
+
+
+class GoogleBackend(TranslatorBackend):
+    name = 'google'
+    # Keeps the plain target language as the key, matching entries cached before backends existed
+    cache_namespace = ''
+
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator()
+
+    def translate_batch(self, texts, target_lang, source_lang='auto', context='manga'):
+        try:
+            results = self.translator.translate(texts, dest=target_lang)
+            return [result.text for result in results]
+        except Exception as e:
+            print(f"Batch translation error: {e}")
+            return [self._translate_one(text, target_lang) for text in texts]
+
+    def _translate_one(self, text: str, target_lang: str) -> Optional[str]:
+        try:
+            return self.translator.translate(text, dest=target_lang).text
+        except Exception as e:
+            print(f"Translation error: {e}")
+            return None
+
+
+class OpenAIBackend(TranslatorBackend):
+    name = 'openai'
+    cache_namespace = 'openai'
+
+    def __init__(self, api_key: Optional[str] = None):
+        api_key = api_key if api_key is not None else os.environ.get('OPENAI_API_KEY', '')
+        self.client = ProviderClient.from_env(
+            'openai', headers={"Authorization": f"Bearer {api_key}"}, max_concurrency=8, timeout=60
+        )
+
+    def chat(self, model: str, messages: List[Dict[str, Any]], max_tokens: int,
+             temperature: Optional[float] = None) -> str:
+        """Call the chat completions endpoint over the pooled session and return the reply text"""
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens}
+        if temperature is not None:
+            payload["temperature"] = temperature
+
+        response = self.client.post(f"{OPENAI_BASE_URL}/chat/completions", json=payload)
+        if response.status_code != 200:
+            raise Exception(f"OpenAI API error {response.status_code}: {response.text[:200]}")
+        return response.json()["choices"][0]["message"]["content"]
+
+    def translate_batch(self, texts, target_lang, source_lang='auto', context='manga'):
+        if len(texts) == 1:
+            return [self._translate_one(texts[0], target_lang, context)]
+
+        chunks = [texts[i:i + AI_TRANSLATE_BATCH_SIZE] for i in range(0, len(texts), AI_TRANSLATE_BATCH_SIZE)]
+        translations = {}
+        failed = []
+        parsed_chunks = self.client.map(lambda chunk: self._translate_chunk(chunk, target_lang, context), chunks)
+        for chunk, parsed in zip(chunks, parsed_chunks):
+            if parsed is None:
+                failed.extend(chunk)
+            else:
+                translations.update(zip(chunk, parsed))
+
+        # Fall back to one request per text, run concurrently, where a reply can't be mapped back
+        translations.update(zip(failed, self.client.map(
+            lambda text: self._translate_one(text, target_lang, context), failed)))
+        return [translations.get(text) for text in texts]
+
+    def _translate_one(self, text: str, target_lang: str, context: str) -> Optional[str]:
+        try:
+            return self.chat(
+                "gpt-4",
+                [
+                    {
+                        "role": "system",
+                        "content": f"You are a professional manga translator. Translate the following text to {target_lang}, preserving the tone, cultural context, and character voice. Consider manga conventions and keep translations concise to fit speech bubbles."
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Translate this {context} text: '{text}'"
+                    }
+                ],
+                max_tokens=200,
+                temperature=0.3
+            ).strip()
+        except Exception as e:
+            print(f"Translation error: {e}")
+            return None
+
+    def _translate_chunk(self, texts: List[str], target_lang: str, context: str) -> Optional[List[str]]:
+        """One numbered GPT-4 request for a chunk of lines; None if it fails or can't be mapped back"""
+        numbered = "\n".join(f"{i + 1}. {text}" for i, text in enumerate(texts))
+        try:
+            content = self.chat(
+                "gpt-4",
+                [
+                    {
+                        "role": "system",
+                        "content": f"You are a professional manga translator. Translate each numbered line to {target_lang}, preserving the tone, cultural context, and character voice. Consider manga conventions and keep translations concise to fit speech bubbles. Reply with exactly one numbered line per input line, in the same order, and nothing else."
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Translate these {context} text lines:\n{numbered}"
+                    }
+                ],
+                max_tokens=min(4000, 200 * len(texts)),
+                temperature=0.3
+            )
+            return parse_numbered_lines(content, len(texts))
+        except Exception as e:
+            print(f"Batch translation error: {e}")
+            return None
+
+
+def parse_numbered_lines(content: str, expected: int) -> Optional[List[str]]:
+    """Map a numbered multi-line reply back to its inputs, or None if it doesn't line up"""
+    results = {}
+    for line in content.strip().splitlines():
+        number, sep, text = line.strip().partition('.')
+        if sep and number.strip().isdigit():
+            results[int(number.strip())] = text.strip()
+
+    if sorted(results) != list(range(1, expected + 1)):
+        return None
+    return [results[i] for i in range(1, expected + 1)]
+
+
+class LocalBackend(TranslatorBackend):
+    """Offline seq2seq translation with transformers (NLLB, or MarianMT via a '{source}-{target}' model template)"""
+
+    name = 'local'
+
+    def __init__(self, models: Optional[ModelRegistry] = None, model_name: str = LOCAL_TRANSLATION_MODEL,
+                 batch_size: int = LOCAL_TRANSLATION_BATCH_SIZE, default_source: str = 'ja'):
+        self.models = models or ModelRegistry()
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.default_source = default_source
+        self.cache_namespace = f"local:{model_name}"
+        self._registered = set()
+        self._lock = threading.Lock()
+
+    def cache_namespace_for(self, target_lang, source_lang='auto'):
+        # A Marian template resolves to a different model per pair, and NLLB is told the source language
+        source_lang, model_name = self._resolve(target_lang, source_lang)
+        return f"local:{model_name}:{source_lang}"
+
+    def _resolve(self, target_lang: str, source_lang: str):
+        """(source language, model name) actually used for a request"""
+        source_lang = self.default_source if source_lang in (None, '', 'auto') else source_lang
+        return source_lang, self.model_name.format(source=source_lang.split('-')[0], target=target_lang.split('-')[0])
+
+    def translate_batch(self, texts, target_lang, source_lang='auto', context='manga'):
+        source_lang, model_name = self._resolve(target_lang, source_lang)
+        marian = '{source}' in self.model_name
+        if not marian and (source_lang not in NLLB_LANGUAGES or target_lang not in NLLB_LANGUAGES):
+            print(f"Local translation does not support {source_lang} -> {target_lang}")
+            return [None] * len(texts)
+
+        try:
+            tokenizer, model = self._get_model(model_name)
+        except Exception as e:
+            print(f"Local translation model error: {e}")
+            return [None] * len(texts)
+
+        import torch
+
+        generate_options = {'max_new_tokens': 256, 'num_beams': LOCAL_TRANSLATION_BEAMS}
+        if not marian:
+            generate_options['forced_bos_token_id'] = tokenizer.convert_tokens_to_ids(NLLB_LANGUAGES[target_lang])
+
+        # Sorting by length keeps padding small inside each batch
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        translations = [None] * len(texts)
+        # The tokenizer's source language is shared state, so one batch runs at a time per process
+        with self._lock:
+            if not marian:
+                tokenizer.src_lang = NLLB_LANGUAGES[source_lang]
+            for start in range(0, len(order), self.batch_size):
+                indices = order[start:start + self.batch_size]
+                inputs = tokenizer([texts[i] for i in indices], return_tensors='pt', padding=True,
+                                   truncation=True, max_length=512)
+                with torch.inference_mode():
+                    outputs = model.generate(**inputs, **generate_options)
+                for i, decoded in zip(indices, tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+                    translations[i] = decoded.strip()
+        return translations
+
+    def _get_model(self, model_name: str):
+        key = f"translator:{model_name}"
+        with self._lock:
+            if key not in self._registered:
+                self.models.register(key, lambda: load_translation_model(model_name))
+                self._registered.add(key)
+        return self.models.get(key)
+
+
+def load_translation_model(model_name: str):
+    """Load a seq2seq translation model and its tokenizer for CPU inference"""
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+    import torch
+
+    num_threads = int(os.environ.get('TORCH_NUM_THREADS', '0'))
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    model.eval()
+    return tokenizer, model
+
+
+class TranslationService:
+    """Cache-aware front end over the registered backends, selectable per call"""
+
+    def __init__(self, cache: TranslationCache, default: Optional[str] = None):
+        self.cache = cache
+        self.default = default or os.environ.get('TRANSLATION_BACKEND', 'google')
+        self._factories = {}
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory):
+        """Register a backend factory; the backend is built on first use"""
+        self._factories[name] = factory
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def resolve(self, name: Optional[str] = None) -> str:
+        name = name or self.default
+        if name not in self._factories:
+            raise Exception(f"Unknown translator backend: {name}")
+        return name
+
+    def get(self, name: Optional[str] = None) -> TranslatorBackend:
+        name = self.resolve(name)
+        with self._lock:
+            backend = self._backends.get(name)
+            if backend is None:
+                backend = self._factories[name]()
+                self._backends[name] = backend
+            return backend
+
+    def translate(self, texts: List[str], target_lang: str, backend: Optional[str] = None,
+                  source_lang: str = 'auto', context: str = 'manga',
+                  progress: Optional[Callable[[int, int], None]] = None) -> List[str]:
+        """Translate texts with one backend call for everything not already cached
+
+        With a progress callback the uncached texts are sent in small chunks instead, and
+        progress(done, total) is called as each chunk of inputs is resolved.
+        """
+        engine = self.get(backend)
+        namespace = engine.cache_namespace_for(target_lang, source_lang)
+        cache_lang = f"{namespace}:{target_lang}" if namespace else target_lang
+
+        translations = {}
+        pending = []
+        for text in dict.fromkeys(texts):
+            cached = self.cache.get(text, cache_lang)
+            if cached is not None:
+                translations[text] = cached
+            else:
+                pending.append(text)
+
+        counts = Counter(texts)
+        done = len(texts) - sum(counts[text] for text in pending)
+        if progress is not None and done:
+            progress(done, len(texts))
+
+        step = TRANSLATE_PROGRESS_CHUNK if progress is not None else len(pending)
+        for start in range(0, len(pending), max(step, 1)):
+            chunk = pending[start:start + step]
+            for text, translated in zip(chunk, engine.translate_batch(chunk, target_lang, source_lang, context)):
+                if translated is not None:
+                    translations[text] = translated
+                    self.cache.set(text, cache_lang, translated)
+            if progress is not None:
+                done += sum(counts[text] for text in chunk)
+                progress(done, len(texts))
+
+        # Failed translations fall back to the source text, as the renderers always did
+        return [translations.get(text, text) for text in texts]
+
+
+def create_translation_service(cache: TranslationCache, models: Optional[ModelRegistry] = None,
+                               openai_backend: Optional[OpenAIBackend] = None,
+                               default: Optional[str] = None) -> TranslationService:
+    """Translation service with the google, openai and local backends registered"""
+    service = TranslationService(cache, default)
+    service.register('google', GoogleBackend)
+    service.register('openai', (lambda: openai_backend) if openai_backend is not None else OpenAIBackend)
+    service.register('local', lambda: LocalBackend(models))
+    return service
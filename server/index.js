@@ -14,6 +14,7 @@ const express = require('express');
 const cors = require('cors');
 const multer = require('multer');
 const path = require('path');
+const fs = require('fs');
 const http = require('http');
 const socketIo = require('socket.io');
 const axios = require('axios');
@@ -38,6 +39,77 @@ const io = socketIo(server, {
 const PORT = process.env.PORT || 5000;
 const AI_SERVICE_URL = process.env.AI_SERVICE_URL || 'http://localhost:5001';
 
+const STAGE_MESSAGES = {
+  download_done: () => 'Image downloaded',
+  ocr_done: (event) => `Found ${event.textAreas} text bubbles`,
+  inpaint_done: () => 'Original text removed',
+  translate_progress: (event) => `Translating ${event.done}/${event.total}...`,
+  translate_done: () => 'Translation finished',
+  render_done: () => 'Translated text placed',
+  preview: () => 'Preview ready',
+  colorize_done: () => 'Coloring finished'
+};
+
+// Call a streaming AI service route, forwarding its stage events to the user's socket room
+const processWithProgress = async (route, payload, room) => {
+  const response = await axios.post(`${AI_SERVICE_URL}${route}`, { ...payload, stream: 'ndjson', preview: true }, {
+    responseType: 'stream'
+  });
+
+  return new Promise((resolve, reject) => {
+    let buffered = '';
+    let result = null;
+
+    response.data.on('data', (chunk) => {
+      buffered += chunk.toString();
+      let newline;
+      while ((newline = buffered.indexOf('\n')) >= 0) {
+        const line = buffered.slice(0, newline).trim();
+        buffered = buffered.slice(newline + 1);
+        if (!line) continue;
+
+        let event;
+        try {
+          event = JSON.parse(line);
+        } catch (error) {
+          continue;
+        }
+
+        if (event.event === 'result') {
+          result = event;
+        } else if (event.event === 'error') {
+          reject(new Error(event.error));
+        } else if (STAGE_MESSAGES[event.event]) {
+          io.to(room).emit('processing_start', { message: STAGE_MESSAGES[event.event](event), ...event });
+        }
+      }
+    });
+    response.data.on('end', () => {
+      if (result) {
+        resolve(result);
+      } else {
+        reject(new Error('AI service stream ended without a result'));
+      }
+    });
+    response.data.on('error', reject);
+  });
+};
+
+// Keep the user's own copy of a processed page for their history; the AI service evicts its
+// artifacts under a size cap, so /api/artifacts links are not permanent
+const saveProcessedImage = async (result) => {
+  const dataUrl = result.processedImage || '';
+  const comma = dataUrl.indexOf(',');
+  const mimeType = dataUrl.slice('data:'.length, dataUrl.indexOf(';'));
+  const extension = { 'image/png': 'png', 'image/webp': 'webp' }[mimeType] || 'jpg';
+  const fileName = `${result.artifactId}.${extension}`;
+  const directory = path.join('uploads', 'processed');
+
+  await fs.promises.mkdir(directory, { recursive: true });
+  await fs.promises.writeFile(path.join(directory, fileName), Buffer.from(dataUrl.slice(comma + 1), 'base64'));
+  return `/uploads/processed/${fileName}`;
+};
+
 // Connect to MongoDB with fallback for development
 const connectDB = async () => {
   try {
@@ -224,19 +296,19 @@ app.post('/api/upload', authenticateToken, upload.single('manga'), async (req, r
       message: 'Processing started...' 
     });
 
-    const response = await axios.post(`${AI_SERVICE_URL}/process`, {
+    const result = await processWithProgress('/process', {
       imagePath: filePath,
       targetLanguage,
       enableColoring,
       coloringStyle,
       textStyle: req.user.preferences.textStyle
-    });
+    }, req.user._id.toString());
 
     // Update user usage and history
     await req.user.incrementUsage();
     req.user.processingHistory.push({
       originalImage: filePath,
-      processedImage: response.data.outputPath,
+      processedImage: await saveProcessedImage(result),
       settings: {
         targetLanguage,
         enableColoring,
@@ -247,7 +319,7 @@ app.post('/api/upload', authenticateToken, upload.single('manga'), async (req, r
 
     res.json({
       success: true,
-      result: response.data,
+      result,
       originalPath: filePath,
       quota: {
         used: req.user.subscription.used,
@@ -294,19 +366,19 @@ app.post('/api/process-url', authenticateToken, async (req, res) => {
       message: 'Downloading image...' 
     });
 
-    const response = await axios.post(`${AI_SERVICE_URL}/process-url`, {
+    const result = await processWithProgress('/process-url', {
       url,
       targetLanguage: finalTargetLanguage,
       enableColoring: finalEnableColoring,
       coloringStyle: finalColoringStyle,
       textStyle: req.user.preferences.textStyle
-    });
+    }, req.user._id.toString());
 
     // Update user usage and history
     await req.user.incrementUsage();
     req.user.processingHistory.push({
       originalImage: url,
-      processedImage: response.data.outputPath,
+      processedImage: await saveProcessedImage(result),
       settings: {
         targetLanguage: finalTargetLanguage,
         enableColoring: finalEnableColoring,
@@ -317,7 +389,7 @@ app.post('/api/process-url', authenticateToken, async (req, res) => {
 
     res.json({
       success: true,
-      result: response.data,
+      result,
       quota: {
         used: req.user.subscription.used,
         total: req.user.subscription.processingQuota
@@ -330,6 +402,31 @@ app.post('/api/process-url', authenticateToken, async (req, res) => {
   }
 });
 
+// Processed pages and downloads are kept by the AI service under their content hash
+app.get('/api/artifacts/:id', authenticateToken, async (req, res) => {
+  if (!/^[0-9a-f]{64}$/.test(req.params.id)) {
+    return res.status(400).json({ error: 'Invalid artifact id' });
+  }
+
+  try {
+    const response = await axios.get(`${AI_SERVICE_URL}/artifacts/${req.params.id}`, {
+      responseType: 'stream'
+    });
+    res.set({
+      'Content-Type': response.headers['content-type'],
+      'Content-Length': response.headers['content-length'],
+      'Cache-Control': 'private, max-age=31536000, immutable'
+    });
+    response.data.pipe(res);
+  } catch (error) {
+    if (error.response && error.response.status === 404) {
+      return res.status(404).json({ error: 'Artifact not found or evicted' });
+    }
+    console.error('Artifact fetch error:', error.message);
+    res.status(502).json({ error: 'Failed to fetch artifact' });
+  }
+});
+
 // Get user processing history
 app.get('/api/history', authenticateToken, async (req, res) => {
   try {